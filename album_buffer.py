@@ -0,0 +1,104 @@
+"""
+Agrupa las partes de un álbum entrante (mismo media_group_id).
+
+Telegram entrega cada foto/video de un álbum como un update separado. El
+buffer junta las partes de cada álbum durante una ventana corta (que se
+reinicia con cada parte nueva) y entrega el álbum completo, en orden, de
+una sola vez: así se reenvía con una única llamada y sigue agrupado en el
+destino.
+
+Un mensaje suelto del mismo chat no puede adelantar a un álbum que aún
+espera: flush_chat() entrega antes los álbumes pendientes de ese chat.
+"""
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Un álbum de Telegram tiene como máximo 10 elementos
+MAX_ALBUM_SIZE = 10
+
+
+class _Album:
+    __slots__ = ('messages', 'deadline', 'task', 'complete')
+
+    def __init__(self, deadline):
+        self.messages = []
+        self.deadline = deadline
+        self.task = None
+        # Se activa para entregar el álbum ya, sin esperar a que venza la ventana
+        self.complete = asyncio.Event()
+
+
+class AlbumBuffer:
+    """Junta las partes de cada álbum y llama a on_flush(messages) una vez."""
+
+    def __init__(self, on_flush, window=1.0):
+        self.on_flush = on_flush
+        self.window = window
+        self._albums = {}
+        self._tasks = {}  # chat_id -> tareas de álbumes pendientes o enviándose
+
+    def add(self, message):
+        """Añade una parte de un álbum (mensaje con media_group_id)."""
+        key = (message.chat_id, message.media_group_id)
+        deadline = time.monotonic() + self.window
+        album = self._albums.get(key)
+        if album is None:
+            album = _Album(deadline)
+            self._albums[key] = album
+            album.task = asyncio.create_task(self._wait_and_flush(key, album))
+            tasks = self._tasks.setdefault(message.chat_id, set())
+            tasks.add(album.task)
+            album.task.add_done_callback(lambda task, chat_id=message.chat_id: self._done(chat_id, task))
+        album.messages.append(message)
+        album.deadline = deadline
+        if len(album.messages) >= MAX_ALBUM_SIZE:
+            # Álbum completo: no hace falta esperar más
+            album.complete.set()
+
+    def _done(self, chat_id, task):
+        tasks = self._tasks.get(chat_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[chat_id]
+
+    async def _wait_and_flush(self, key, album):
+        while not album.complete.is_set():
+            delay = album.deadline - time.monotonic()
+            if delay <= 0:
+                break
+            try:
+                await asyncio.wait_for(album.complete.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        await self._flush(key, album)
+
+    async def _flush(self, key, album):
+        if self._albums.get(key) is album:
+            del self._albums[key]
+        messages = sorted(album.messages, key=lambda m: m.message_id)
+        try:
+            await self.on_flush(messages)
+        except Exception as e:
+            logger.error(f"❌ Error reenviando el álbum {key[1]}: {e}")
+
+    async def flush_chat(self, chat_id):
+        """Entrega ya los álbumes de un chat (pendientes o enviándose) y espera a que terminen."""
+        tasks = list(self._tasks.get(chat_id, ()))
+        if not tasks:
+            return
+        for key, album in list(self._albums.items()):
+            if key[0] == chat_id:
+                album.complete.set()
+        await asyncio.gather(*tasks)
+
+    async def flush_all(self):
+        """Entrega ya todos los álbumes pendientes (al detener el bot)."""
+        albums = list(self._albums.values())
+        for album in albums:
+            album.complete.set()
+        await asyncio.gather(*(album.task for album in albums))
@@ -0,0 +1,239 @@
+"""
+Sustitutos locales para los benchmarks: un servidor Bot API falso y
+versiones simuladas de yt-dlp, TikWM e Instaloader con latencia, tamaño
+de archivo y tasa de fallos configurables. Nada sale a la red.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import itertools
+from contextlib import contextmanager
+
+from aiohttp import web
+
+CHUNK = b'\0' * (1024 * 1024)
+
+
+def write_file(path, size_bytes):
+    """Escribe un archivo de size_bytes (bloques reales en disco, no sparse)."""
+    with open(path, 'wb') as f:
+        remaining = size_bytes
+        while remaining > 0:
+            chunk = CHUNK[:min(len(CHUNK), remaining)]
+            f.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+
+class StandIn:
+    """Comportamiento simulado de una dependencia externa."""
+
+    def __init__(self, latency=0.1, size_kb=512, failure_rate=0.0, jitter=0.2):
+        self.latency = latency
+        self.size_kb = size_kb
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.calls = 0
+
+    def delay(self):
+        return max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def maybe_fail(self, name):
+        self.calls += 1
+        if random.random() < self.failure_rate:
+            raise Exception(f"{name} simulado: fallo (HTTP Error 403: Forbidden)")
+
+
+class FakeYoutubeDL:
+    """Imita la parte de YoutubeDL que usa download_media."""
+
+    def __init__(self, stand_in, probe_latency=0.05):
+        self.stand_in = stand_in
+        self.probe_latency = probe_latency
+        self.outtmpl = None
+
+    def extract_info(self, url, download=False):
+        time.sleep(self.probe_latency)
+        self.stand_in.maybe_fail('yt-dlp')
+        video_id = url.rstrip('/').rsplit('/', 1)[-1]
+        return {
+            'id': video_id,
+            'title': f'Video {video_id}',
+            'ext': 'mp4',
+            'duration': 30,
+            'vcodec': 'h264',
+            'filesize': self.stand_in.size_kb * 1024,
+        }
+
+    def process_ie_result(self, info, download=True):
+        time.sleep(self.stand_in.delay())
+        write_file(self.prepare_filename(info), info['filesize'])
+        return info
+
+    def prepare_filename(self, info):
+        return self.outtmpl % {'autonumber': '00001', 'ext': info['ext'], 'id': info['id']}
+
+
+class FakeYoutubeDLPool:
+    """Sustituto de downloader.ytdl_pool."""
+
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+
+    @contextmanager
+    def acquire(self, outtmpl=None, **options):
+        ydl = FakeYoutubeDL(self.stand_in)
+        ydl.outtmpl = outtmpl
+        yield ydl
+
+    def warm_up(self, ie_keys=()):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_tikwm(stand_in, images=10):
+    """Sustituto de downloader.download_tiktok_slideshow_tikwm."""
+    def download(url, temp_dir, unique_id, streaming=False):
+        time.sleep(stand_in.delay())
+        stand_in.maybe_fail('TikWM')
+        files = [
+            write_file(os.path.join(temp_dir, f"{unique_id}_{i}.jpg"), stand_in.size_kb * 1024)
+            for i in range(images)
+        ]
+        return files, 'TikTok Slideshow'
+    return download
+
+
+def fake_instaloader(stand_in):
+    """Sustituto de downloader.download_instagram_via_instaloader."""
+    def download(url, temp_dir, unique_id):
+        time.sleep(stand_in.delay())
+        stand_in.maybe_fail('Instaloader')
+        path = write_file(os.path.join(temp_dir, f"{unique_id}_1.mp4"), stand_in.size_kb * 1024)
+        return [path], 'Instagram Post'
+    return download
+
+
+class FakeBotAPI:
+    """
+    Servidor Bot API mínimo (aiohttp) que responde a los métodos que usa el
+    bot con mensajes verosímiles. Lee y descarta los archivos subidos.
+    Como un servidor telegram-bot-api --local, acepta también archivos por
+    ruta (file://...): comprueba que existen y los lee del disco.
+    """
+
+    def __init__(self, latency=0.02, upload_mb_per_s=50.0):
+        self.latency = latency
+        self.upload_mb_per_s = upload_mb_per_s
+        self.calls = {}
+        self.bytes_received = 0
+        self.local_bytes = 0
+        self._ids = itertools.count(1)
+        self._runner = None
+        self.port = None
+
+        self.app = web.Application(client_max_size=2 * 1024 ** 3)
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    def _message(self, chat_id, **media):
+        message_id = next(self._ids)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private' if int(chat_id) > 0 else 'supergroup'},
+            **media,
+        }
+
+    def _file(self, kind):
+        n = next(self._ids)
+        return {'file_id': f'{kind}-{n}', 'file_unique_id': f'u{kind}{n}'}
+
+    async def _params(self, request):
+        if request.content_type.startswith('multipart/'):
+            params = {}
+            reader = await request.multipart()
+            async for part in reader:
+                data = await part.read()
+                self.bytes_received += len(data)
+                if part.filename is None:
+                    params[part.name] = data.decode(errors='ignore')
+            return params
+        if request.content_type == 'application/json':
+            return await request.json()
+        return dict(await request.post())
+
+    def _local_files(self, params):
+        """Rutas file:// referenciadas en los parámetros (incluido un álbum)."""
+        values = list(params.values())
+        media = params.get('media')
+        if isinstance(media, str) and media.startswith('['):
+            media = json.loads(media)
+        if isinstance(media, list):
+            values.extend(item.get('media') for item in media)
+        return [v[len('file://'):] for v in values if isinstance(v, str) and v.startswith('file://')]
+
+    def _read_local(self, path):
+        size = 0
+        with open(path, 'rb') as f:
+            while chunk := f.read(len(CHUNK)):
+                size += len(chunk)
+        return size
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        received_before = self.bytes_received
+        params = await self._params(request)
+        uploaded = self.bytes_received - received_before
+        for path in self._local_files(params):
+            if not os.path.isfile(path):
+                return web.json_response(
+                    {'ok': False, 'error_code': 400, 'description': 'Bad Request: file not found'}
+                )
+            self.local_bytes += await asyncio.to_thread(self._read_local, path)
+        await asyncio.sleep(self.latency + uploaded / (self.upload_mb_per_s * 1024 * 1024))
+
+        chat_id = params.get('chat_id', 0)
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot',
+                      'can_join_groups': True, 'can_read_all_group_messages': True,
+                      'supports_inline_queries': False}
+        elif method == 'sendMessage':
+            result = self._message(chat_id, text=params.get('text', ''))
+        elif method == 'sendVideo':
+            result = self._message(chat_id, video={**self._file('video'), 'width': 720, 'height': 1280, 'duration': 30})
+        elif method == 'sendAudio':
+            result = self._message(chat_id, audio={**self._file('audio'), 'duration': 30})
+        elif method == 'sendPhoto':
+            result = self._message(chat_id, photo=[{**self._file('photo'), 'width': 1080, 'height': 1920}])
+        elif method == 'sendMediaGroup':
+            media = params.get('media', '[]')
+            media = json.loads(media) if isinstance(media, str) else media
+            result = [
+                self._message(chat_id, photo=[{**self._file('photo'), 'width': 1080, 'height': 1920}])
+                for _ in media
+            ]
+        elif method in ('forwardMessages', 'copyMessages'):
+            ids = params.get('message_ids', '[]')
+            ids = json.loads(ids) if isinstance(ids, str) else ids
+            result = [{'message_id': next(self._ids)} for _ in ids]
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
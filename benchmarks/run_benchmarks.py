@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Benchmarks offline de los handlers y del downloader.
+
+Lanza handle_media y handle_url con Updates sintéticos contra un servidor
+Bot API falso, con yt-dlp, TikWM e Instaloader sustituidos por versiones
+locales (latencia, tamaño y tasa de fallos configurables). Por escenario
+mide throughput, latencia p50/p95/p99, pico de RSS y pico de disco
+temporal, y guarda el resultado en JSON para comparar ejecuciones.
+
+    python3 benchmarks/run_benchmarks.py                      # todos los escenarios
+    python3 benchmarks/run_benchmarks.py -s viral_duplicates  # uno concreto
+    python3 benchmarks/run_benchmarks.py --scale 2 -o results.json
+    python3 benchmarks/run_benchmarks.py --local-bot-api      # archivos por ruta (servidor local)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import platform
+import subprocess
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import StandIn, FakeBotAPI, FakeYoutubeDLPool, fake_tikwm, fake_instaloader
+
+SOURCE_CHAT = -1001000000001
+DESTINATION_CHAT = -1001000000002
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Escenarios: número de peticiones y comportamiento de los sustitutos
+SCENARIOS = {
+    'media_forward_burst': {
+        'description': 'Ráfaga de fotos/videos reenviados por handle_media',
+        'kind': 'media', 'count': 200,
+    },
+    'slideshow_burst': {
+        'description': 'Slideshows de TikTok distintos (10 imágenes cada uno)',
+        'kind': 'url', 'count': 30,
+        'url': 'https://www.tiktok.com/@bench/photo/{n}',
+        'tikwm': dict(latency=0.3, size_kb=300),
+    },
+    'viral_duplicates': {
+        'description': 'Muchos usuarios pegan el mismo enlace a la vez',
+        'kind': 'url', 'count': 50, 'same_url': True,
+        'url': 'https://www.tiktok.com/@bench/video/{n}',
+        'ytdlp': dict(latency=1.0, size_kb=8 * 1024),
+    },
+    'large_video_flood': {
+        'description': 'Videos grandes distintos (cerca del límite de subida)',
+        'kind': 'url', 'count': 12,
+        'url': 'https://www.tiktok.com/@bench/video/{n}',
+        'ytdlp': dict(latency=1.5, size_kb=30 * 1024),
+    },
+    'flaky_instagram': {
+        'description': 'Instagram con yt-dlp fallando (respaldo con Instaloader)',
+        'kind': 'url', 'count': 30,
+        'url': 'https://www.instagram.com/p/BENCH{n}/',
+        'ytdlp': dict(latency=0.3, size_kb=2 * 1024, failure_rate=0.5),
+        'instaloader': dict(latency=0.6, size_kb=2 * 1024),
+    },
+}
+
+
+def configure_environment(work_dir, args):
+    """Variables de entorno del bot antes de importarlo (todo dentro de work_dir)."""
+    os.environ.update({
+        'BOT_TOKEN': '123456:BENCHMARK',
+        'SOURCE_CHAT_ID': str(SOURCE_CHAT),
+        'DESTINATION_CHAT_ID': str(DESTINATION_CHAT),
+        'BOT_ROLE': 'all',
+        'QUEUE_BACKEND': 'sqlite',
+        'DOWNLOAD_POOL': 'thread',  # los sustitutos solo existen en este proceso
+        'DOWNLOAD_WORKERS': str(args.workers),
+        'QUEUE_WORKERS': str(args.workers),
+        'DOWNLOAD_WORKERS_PER_USER': '2',
+        'QUEUE_POLL_INTERVAL': '0.5',
+        'MEDIA_CACHE_PATH': os.path.join(work_dir, 'data', 'media_cache.sqlite3'),
+        'DOWNLOAD_QUEUE_PATH': os.path.join(work_dir, 'data', 'download_queue.sqlite3'),
+        'SEEN_INDEX_PATH': os.path.join(work_dir, 'data', 'seen_index.sqlite3'),
+        'STREAM_MODE': 'false',
+        'METRICS_PORT': '0',
+        'MIN_FREE_DISK_MB': '0',
+    })
+    if args.local_bot_api:
+        # Activa el modo local (archivos por ruta); el Bot apunta al servidor falso
+        os.environ['LOCAL_BOT_API_URL'] = 'http://127.0.0.1'
+    if not args.telegram_limits:
+        # Sin los límites de ritmo de Telegram: se mide el pipeline, no las esperas
+        os.environ.update({
+            'SEND_GLOBAL_RATE': '100000',
+            'SEND_PRIVATE_RATE': '100000',
+            'SEND_GROUP_RATE_PER_MIN': '6000000',
+        })
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Sampler:
+    """Muestrea RSS y disco temporal en segundo plano para obtener los picos."""
+
+    def __init__(self, temp_dir, interval=0.05):
+        self.temp_dir = temp_dir
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._task = None
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, rss_bytes())
+        self.peak_disk = max(self.peak_disk, dir_bytes(self.temp_dir))
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def make_update(update_id, chat_id, text=None, photo=False):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+        'from': {'id': abs(chat_id), 'is_bot': False, 'first_name': f'user{abs(chat_id)}'},
+    }
+    if text is not None:
+        message['text'] = text
+    if photo:
+        message['photo'] = [{'file_id': f'src-{update_id}', 'file_unique_id': f'usrc{update_id}',
+                             'width': 800, 'height': 600}]
+    return {'update_id': update_id, 'message': message}
+
+
+class Harness:
+    """Instala los sustitutos, arranca los workers y ejecuta escenarios."""
+
+    def __init__(self, args, work_dir):
+        self.args = args
+        self.work_dir = work_dir
+        self.update_ids = iter(range(1, 10 ** 9))
+
+        import bot
+        import worker
+        import downloader
+        from telegram import Bot, Update
+        from telegram.request import HTTPXRequest
+        from strategy_stats import StrategyStats
+
+        self.bot_module = bot
+        self.worker = worker
+        self.downloader = downloader
+        self.Bot = Bot
+        self.Update = Update
+        self.HTTPXRequest = HTTPXRequest
+        self.StrategyStats = StrategyStats
+        self.finished = {}
+
+        # Medir cada trabajo: desde que se encola hasta que termina de enviarse
+        original = worker.process_url_job
+
+        async def timed_process(bot_, job):
+            try:
+                await original(bot_, job)
+                ok = True
+            except Exception:
+                ok = False
+                raise
+            finally:
+                self.finished[job['id']] = (time.time() - job['created_at'], ok)
+        worker.process_url_job = timed_process
+
+    def install_stand_ins(self, scenario):
+        d = self.downloader
+        d.ytdl_pool = FakeYoutubeDLPool(StandIn(**scenario.get('ytdlp', {})))
+        d.download_tiktok_slideshow_tikwm = fake_tikwm(StandIn(**scenario.get('tikwm', {})))
+        d.download_instagram_via_instaloader = fake_instaloader(StandIn(**scenario.get('instaloader', {})))
+        # Historial limpio: cada escenario parte del orden por defecto
+        d.strategy_stats = self.StrategyStats()
+
+    async def start(self):
+        self.api = FakeBotAPI(latency=self.args.api_latency, upload_mb_per_s=self.args.upload_mbps)
+        base_url = await self.api.start()
+        self.bot = self.Bot(
+            self.bot_module.BOT_TOKEN, base_url=base_url, local_mode=self.args.local_bot_api,
+            request=self.HTTPXRequest(connection_pool_size=256)
+        )
+        await self.bot.initialize()
+        self.context = SimpleNamespace(bot=self.bot)
+        self.worker.start_workers(self.bot)
+
+    async def stop(self):
+        await self.worker.stop_workers()
+        await self.bot.shutdown()
+        await self.api.stop()
+
+    async def run_media(self, scenario):
+        latencies = []
+
+        async def one(i):
+            update = self.Update.de_json(make_update(next(self.update_ids), SOURCE_CHAT, photo=True), self.bot)
+            start = time.perf_counter()
+            await self.bot_module.handle_media(update, self.context)
+            latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(i) for i in range(scenario['count'])))
+        return latencies, scenario['count'], 0
+
+    async def run_urls(self, name, scenario):
+        count = scenario['count']
+        tag = f"{name}{int(time.time() * 1000)}"
+        job_ids_before = set(self.finished)
+        queue = self.worker.download_queue
+
+        for i in range(count):
+            n = tag if scenario.get('same_url') else f"{tag}{i}"
+            url = scenario['url'].format(n=n)
+            user_chat = 10_000 + i  # cada petición de un usuario distinto
+            update = self.Update.de_json(make_update(next(self.update_ids), user_chat, text=url), self.bot)
+            await self.bot_module.handle_url(update, self.context)
+
+        deadline = time.time() + self.args.timeout
+        while len(set(self.finished) - job_ids_before) < count and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        # Dejar que terminen los reintentos/limpiezas pendientes
+        while queue.depth() and time.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        results = [self.finished[j] for j in set(self.finished) - job_ids_before]
+        latencies = [latency for latency, ok in results if ok]
+        errors = sum(1 for _, ok in results if not ok)
+        return latencies, count, errors
+
+    async def run_scenario(self, name, scenario):
+        self.install_stand_ins(scenario)
+        calls_before = dict(self.api.calls)
+        bytes_before = self.api.bytes_received
+        local_before = self.api.local_bytes
+        temp_dir = os.path.join(self.work_dir, 'downloads')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        with Sampler(temp_dir) as sampler:
+            start = time.perf_counter()
+            if scenario['kind'] == 'media':
+                latencies, requests, errors = await self.run_media(scenario)
+            else:
+                latencies, requests, errors = await self.run_urls(name, scenario)
+            elapsed = time.perf_counter() - start
+
+        return {
+            'description': scenario['description'],
+            'requests': requests,
+            'completed': len(latencies),
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                p: round(percentile(latencies, q) * 1000, 1) if latencies else None
+                for p, q in (('p50', 50), ('p95', 95), ('p99', 99))
+            },
+            'peak_rss_mb': round(sampler.peak_rss / 1024 ** 2, 1),
+            'peak_temp_disk_mb': round(sampler.peak_disk / 1024 ** 2, 1),
+            'leftover_temp_disk_mb': round(dir_bytes(temp_dir) / 1024 ** 2, 1),
+            'uploaded_mb': round((self.api.bytes_received - bytes_before) / 1024 ** 2, 1),
+            'local_path_mb': round((self.api.local_bytes - local_before) / 1024 ** 2, 1),
+            'api_calls': {
+                method: n - calls_before.get(method, 0)
+                for method, n in self.api.calls.items() if n - calls_before.get(method, 0)
+            },
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+async def run(args, work_dir):
+    harness = Harness(args, work_dir)
+    await harness.start()
+    results = {}
+    try:
+        for name in args.scenarios:
+            scenario = dict(SCENARIOS[name])
+            scenario['count'] = max(1, int(scenario['count'] * args.scale))
+            print(f"▶ {name} ({scenario['count']} peticiones)...", file=sys.stderr)
+            results[name] = await harness.run_scenario(name, scenario)
+    finally:
+        await harness.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks offline del bot')
+    parser.add_argument('-s', '--scenario', dest='scenarios', action='append', choices=sorted(SCENARIOS),
+                        help='Escenario a ejecutar (repetible). Por defecto, todos.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplicador del número de peticiones')
+    parser.add_argument('--workers', type=int, default=4, help='DOWNLOAD_WORKERS / QUEUE_WORKERS')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='Latencia del Bot API falso (s)')
+    parser.add_argument('--upload-mbps', type=float, default=50.0, help='Velocidad de subida simulada (MB/s)')
+    parser.add_argument('--local-bot-api', action='store_true',
+                        help='Modo servidor Bot API local (archivos por ruta, sin subirlos)')
+    parser.add_argument('--telegram-limits', action='store_true', help='Respetar los límites de ritmo reales')
+    parser.add_argument('--timeout', type=float, default=300.0, help='Tiempo máximo por escenario (s)')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('-o', '--output', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    random.seed(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='bot_bench_')
+    configure_environment(work_dir, args)
+    # download_media escribe en ./downloads: trabajar dentro del directorio temporal
+    os.chdir(work_dir)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    try:
+        results = asyncio.run(run(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'settings': {
+            'scale': args.scale, 'workers': args.workers, 'api_latency': args.api_latency,
+            'upload_mbps': args.upload_mbps, 'telegram_limits': args.telegram_limits, 'seed': args.seed,
+            'local_bot_api': args.local_bot_api,
+        },
+        'scenarios': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
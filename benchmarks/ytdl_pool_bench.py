@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: YoutubeDL nuevo por petición vs. instancias del pool.
+
+Sirve un MP4 pequeño desde un servidor HTTP local (sin red externa) y lo
+descarga N veces con yt-dlp de las dos formas. Imprime (o guarda) un JSON
+con la latencia de la primera petición y p50/p95/media del resto. El modo
+'fresh' corre primero, así que su primera petición incluye además la
+importación de los extractores (el arranque en frío tras un deploy).
+
+    python3 benchmarks/ytdl_pool_bench.py --requests 50 --output ytdl_pool.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from ytdl_pool import YoutubeDLPool
+from downloader import YTDLP_BASE_OPTS
+
+BENCH_OPTS = dict(YTDLP_BASE_OPTS, noprogress=True)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # yt-dlp corta conexiones a propósito (sondeo de Range): no es un error
+        pass
+
+
+def serve(directory):
+    server = _QuietServer(('127.0.0.1', 0), partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies):
+    rest = latencies[1:] or latencies
+    return {
+        'first_ms': round(latencies[0] * 1000, 2),
+        'mean_ms': round(statistics.mean(rest) * 1000, 2),
+        'p50_ms': round(percentile(rest, 50) * 1000, 2),
+        'p95_ms': round(percentile(rest, 95) * 1000, 2),
+    }
+
+
+def run_fresh(url, out_dir, requests):
+    latencies = []
+    for i in range(requests):
+        opts = dict(BENCH_OPTS, outtmpl=os.path.join(out_dir, f'fresh_{i}.%(ext)s'), format='best')
+        start = time.perf_counter()
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.extract_info(url, download=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_pooled(url, out_dir, requests, pool_size):
+    pool = YoutubeDLPool(BENCH_OPTS, size=pool_size)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        with pool.acquire(outtmpl=os.path.join(out_dir, f'pooled_{i}.%(ext)s'), format='best') as ydl:
+            ydl.extract_info(url, download=True)
+        latencies.append(time.perf_counter() - start)
+    pool.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--pool-size', type=int, default=1)
+    parser.add_argument('--output', help='Archivo JSON de resultados (por defecto, stdout)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='ytdl_bench_')
+    try:
+        media_dir = os.path.join(work_dir, 'media')
+        out_dir = os.path.join(work_dir, 'out')
+        os.makedirs(media_dir)
+        os.makedirs(out_dir)
+        with open(os.path.join(media_dir, 'clip.mp4'), 'wb') as f:
+            f.write(os.urandom(args.size_kb * 1024))
+
+        server = serve(media_dir)
+        url = f'http://127.0.0.1:{server.server_address[1]}/clip.mp4'
+
+        results = {
+            'requests': args.requests,
+            'size_kb': args.size_kb,
+            'yt_dlp': yt_dlp.version.__version__,
+            'fresh': summarize(run_fresh(url, out_dir, args.requests)),
+            'pooled': summarize(run_pooled(url, out_dir, args.requests, args.pool_size)),
+        }
+        results['speedup_p50'] = round(results['fresh']['p50_ms'] / results['pooled']['p50_ms'], 2)
+        server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,8 @@ Bot de Telegram para reenviar videos, fotos y documentos
 entre canales/grupos automáticamente.
 """
 
-import os
+import asyncio
 import logging
-from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -15,14 +14,21 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from downloader import download_media
-
-# Dominios soportados (Solo TikTok, Instagram, Spotify)
-SUPPORTED_DOMAINS = [
-    'tiktok.com', 'vm.tiktok.com',
-    'instagram.com',
-    'open.spotify.com'
-]
+from config import (
+    BOT_TOKEN, LOCAL_BOT_API_URL, LOCAL_BOT_API_BASE_URL, LOCAL_BOT_API_FILE_URL, LOCAL_BOT_API_TIMEOUT,
+    SOURCE_CHAT_ID, DESTINATION_CHAT_ID, DESTINATION_CHAT_IDS, BOT_ROLE,
+    DOWNLOAD_WORKERS, DOWNLOAD_WORKERS_PER_USER, DOWNLOAD_POOL, QUEUE_BACKEND,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    METRICS_PORT, FORWARD_DEDUP, SEEN_INDEX_PATH, SEEN_WINDOW, SEEN_BLOOM_CAPACITY,
+    ROUTES_FILE, ROUTES_RELOAD_INTERVAL, ALBUM_WINDOW
+)
+from send_scheduler import scheduler
+from seen_index import SeenIndex
+from routing import Router
+from links import extract_links
+from album_buffer import AlbumBuffer
+from worker import download_queue, download_pool, queue_event, start_workers, stop_workers
+from metrics import timed, start_metrics_server, HANDLER_SECONDS, FORWARDS_TOTAL
 
 # Configurar logging
 logging.basicConfig(
@@ -31,70 +37,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Cargar variables de entorno
-load_dotenv()
-def get_chat_id(env_var):
-    """Obtiene y limpia el ID del chat de las variables de entorno."""
-    val = os.getenv(env_var, '')
-    if not val:
-        return None
-    # Limpiar espacios y comillas comunes
-    val = val.strip().strip("'").strip('"')
-    # Corregir error común de doble guión (copy-paste) -> --100... a -100...
-    while val.startswith('--'):
-        val = val[1:]
-    return int(val)
-
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-SOURCE_CHAT_ID = get_chat_id('SOURCE_CHAT_ID')
-DESTINATION_CHAT_ID = get_chat_id('DESTINATION_CHAT_ID')
+# Solo los tipos de update que consumen nuestros handlers
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHANNEL_POST]
+
+# Índice de mensajes/archivos ya reenviados (evita duplicados en el destino)
+seen_index = SeenIndex(
+    SEEN_INDEX_PATH,
+    window=SEEN_WINDOW,
+    capacity=SEEN_BLOOM_CAPACITY
+) if FORWARD_DEDUP else None
+
+# Rutas de reenvío. Sin ROUTES_FILE: cualquier origen -> DESTINATION_CHAT_ID
+router = Router(
+    ROUTES_FILE or None,
+    default_routes=[{'name': 'default', 'source': '*', 'destinations': [DESTINATION_CHAT_ID]}]
+    if DESTINATION_CHAT_ID else [],
+    reload_interval=ROUTES_RELOAD_INTERVAL
+)
+
+
+def forward_keys(message, media, destination):
+    """Claves de deduplicación por destino: el mensaje de origen y el archivo en sí."""
+    return [
+        f"msg:{destination}:{message.chat_id}:{message.message_id}",
+        f"file:{destination}:{media.file_unique_id}",
+    ]
+
+
+def detect_media(message):
+    """Tipo de medio del mensaje: (tipo, etiqueta, objeto) o (None, None, None)."""
+    if message.photo:
+        return 'photo', "📷 Foto", message.photo[-1]
+    if message.video:
+        return 'video', "🎥 Video", message.video
+    if message.document:
+        return 'document', "📄 Documento", message.document
+    return None, None, None
+
+
+async def forward_media(bot, messages):
+    """
+    Reenvía mensajes de un mismo origen: uno suelto o las partes de un álbum.
+    Cada destino recibe sus mensajes en una sola llamada (el álbum sigue agrupado).
+    """
+    chat_id = messages[0].chat_id
+    # En un álbum el caption suele ir solo en la primera parte: vale para todo el álbum
+    caption = next((m.caption for m in messages if m.caption), None)
+    label = "🖼️ Álbum" if len(messages) > 1 else None
+
+    plan = {}  # destino -> [(mensaje, claves)]
+    for message in messages:
+        kind, media_type, media = detect_media(message)
+        if not kind:
+            continue
+        label = label or media_type
+        for destination in router.destinations(chat_id, kind, caption, media.file_size):
+            # Duplicado (reenvío repetido, repost o update reprocesado): no llamar a la API
+            keys = forward_keys(message, media, destination)
+            if seen_index and seen_index.check_and_add(keys):
+                FORWARDS_TOTAL.labels(method='duplicate').inc()
+                logger.info(f"⏭️ {media_type} duplicado en {destination}, no se reenvía")
+                continue
+            plan.setdefault(destination, []).append((message, keys))
+
+    if not plan:
+        logger.debug(f"🧭 {label} de {chat_id} sin rutas pendientes, se ignora")
+        return
+
+    with timed(HANDLER_SECONDS, handler='handle_media'):
+        # Reenviar vía el planificador: respeta los límites de Telegram y
+        # agrupa ráfagas del mismo origen (forward, con fallback a copy).
+        # Los destinos se atienden en paralelo.
+        results = await asyncio.gather(*(
+            scheduler.forward(bot, destination, chat_id, [m.message_id for m, _ in entries])
+            for destination, entries in plan.items()
+        ), return_exceptions=True)
+
+    for (destination, entries), result in zip(plan.items(), results):
+        if isinstance(result, Exception):
+            FORWARDS_TOTAL.labels(method='failed').inc(len(entries))
+            logger.error(f"❌ Error CRÍTICO: No se pudo ni reenviar ni copiar a {destination}: {result}")
+            # Que un reintento posterior no se tome por duplicado
+            if seen_index:
+                seen_index.forget([key for _, keys in entries for key in keys])
+            continue
+        FORWARDS_TOTAL.labels(method=result).inc(len(entries))
+        action = "reenviado (Forward)" if result == 'forward' else "copiado (Copy)"
+        count = f" ({len(entries)} elementos)" if len(entries) > 1 else ""
+        logger.info(f"✅ {label}{count} {action} a {destination}")
+
+
+# Partes de álbumes entrantes: se reenvían juntas cuando llega el álbum completo
+album_buffer = AlbumBuffer(
+    lambda messages: forward_media(messages[0].get_bot(), messages),
+    window=ALBUM_WINDOW
+)
 
 
 async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Maneja mensajes con medios (fotos, videos, documentos).
-    Solo reenvía si provienen del canal/grupo origen.
+    Los destinos salen de la tabla de rutas (origen, tipo de medio y filtros).
     """
     message = update.message or update.channel_post
     
     if not message:
         return
     
-    # Verificar que el mensaje viene del canal/grupo origen
-    # (DESACTIVADO: Permitir acceso universal desde DMs u otros grupos)
-    # if message.chat_id != SOURCE_CHAT_ID:
-    #     return
-    
     try:
-        # Determinar el tipo de medio
-        media_type = None
-        if message.photo:
-            media_type = "📷 Foto"
-        elif message.video:
-            media_type = "🎥 Video"
-        elif message.document:
-            media_type = "📄 Documento"
-        
-        if media_type:
-            try:
-                # Intentar reenviar (Mantiene "Reenviado de...")
-                await message.forward(chat_id=DESTINATION_CHAT_ID)
-                logger.info(f"✅ {media_type} reenviado (Forward) a {DESTINATION_CHAT_ID}")
-            except Exception as e:
-                logger.warning(f"⚠️ No se pudo reenviar (Forward): {e}. Intentando copiar...")
-                # Fallback: Copiar contenido (Si falla forward por privacidad/permisos)
-                try:
-                    await message.copy(chat_id=DESTINATION_CHAT_ID)
-                    logger.info(f"✅ {media_type} copiado (Copy) a {DESTINATION_CHAT_ID}")
-                except Exception as e2:
-                    logger.error(f"❌ Error CRÍTICO: No se pudo ni reenviar ni copiar: {e2}")
+        if message.media_group_id:
+            album_buffer.add(message)
+            return
+        # Un álbum anterior del mismo chat aún en el buffer se reenvía antes (mantiene el orden)
+        await album_buffer.flush_chat(message.chat_id)
+        await forward_media(context.bot, [message])
     
     except Exception as e:
         logger.error(f"❌ Error general en handle_media: {e}")
 
 
 async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Detecta enlaces y descarga contenido multimedia."""
+    """Detecta enlaces y descarga contenido multimedia (todos los del mensaje)."""
     message = update.message or update.channel_post
     
     if not message or not message.text:
@@ -104,138 +167,20 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # if message.chat_id != SOURCE_CHAT_ID:
     #    return
 
-    text = message.text.lower()
-    
-    # Verificar si contiene un link soportado
-    if not any(domain in text for domain in SUPPORTED_DOMAINS):
+    links = extract_links(message)
+    if not links:
         return
 
-    # Extraer URL (simple)
-    url = None
-    for word in message.text.split():
-        if word.startswith('http') and any(d in word for d in SUPPORTED_DOMAINS):
-            url = word
-            break
-            
-    if not url:
-        return
-
-    # Notificar que se está procesando (opcional, solo log)
-    logger.info(f"🔗 Detectado enlace: {url}")
+    for url, platform in links:
+        logger.info(f"🔗 Detectado enlace ({platform}): {url}")
     
     # Obtener el ID del usuario que pidió el link
     user_chat_id = update.effective_chat.id
 
-    # Descargar
-    downloaded_files = None
-    try:
-        downloaded_files, media_type, title = download_media(url)
-        
-        if downloaded_files and all(os.path.exists(f) for f in downloaded_files):
-            # Caption SIN URL (según solicitud del usuario)
-            caption = f"🎥 {title}"
-            
-            # Función helper para enviar media
-            async def send_media_to_chat(chat_id):
-                """Envía el media al chat especificado."""
-                try:
-                    if media_type == 'photo' and len(downloaded_files) > 1:
-                        # TikTok Slideshow: Enviar como álbum de fotos
-                        from telegram import InputMediaPhoto
-                        media_group = []
-                        
-                        for i, file_path in enumerate(downloaded_files[:10]):  # Límite 10 fotos por grupo
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=open(file_path, 'rb'),
-                                    caption=caption if i == 0 else None  # Solo primera foto con caption
-                                )
-                            )
-                        
-                        await context.bot.send_media_group(
-                            chat_id=chat_id,
-                            media=media_group
-                        )
-                        logger.info(f"✅ {len(downloaded_files)} fotos enviadas como álbum a {chat_id}")
-                    
-                    elif media_type == 'video':
-                        await context.bot.send_video(
-                            chat_id=chat_id,
-                            video=open(downloaded_files[0], 'rb'),
-                            caption=caption,
-                            supports_streaming=True
-                        )
-                        logger.info(f"✅ Video enviado a {chat_id}")
-                        
-                    elif media_type == 'audio':
-                        await context.bot.send_audio(
-                            chat_id=chat_id,
-                            audio=open(downloaded_files[0], 'rb'),
-                            caption=caption
-                        )
-                        logger.info(f"✅ Audio enviado a {chat_id}")
-                        
-                    elif media_type == 'photo':
-                        # Una sola foto
-                        await context.bot.send_photo(
-                            chat_id=chat_id,
-                            photo=open(downloaded_files[0], 'rb'),
-                            caption=caption
-                        )
-                        logger.info(f"✅ Foto enviada a {chat_id}")
-                    
-                    return True
-                except Exception as e:
-                    logger.error(f"❌ Error enviando archivo a {chat_id}: {e}")
-                    return False
-            
-            # 1. Enviar al usuario que lo pidió
-            user_success = await send_media_to_chat(user_chat_id)
-            
-            # 2. Enviar al canal/grupo destino (si es diferente al usuario)
-            dest_success = False
-            if user_chat_id != DESTINATION_CHAT_ID:
-                dest_success = await send_media_to_chat(DESTINATION_CHAT_ID)
-            else:
-                dest_success = True  # Es el mismo chat
-            
-            # 3. Mensaje de confirmación al usuario
-            if user_success and dest_success:
-                await context.bot.send_message(
-                    chat_id=user_chat_id,
-                    text="✅ Descarga completada"
-                )
-            elif user_success:
-                await context.bot.send_message(
-                    chat_id=user_chat_id,
-                    text="✅ Descarga completada"
-                )
-        else:
-             logger.warning(f"⚠️ No se pudo descargar contenido de: {url}")
-             # Notificar al usuario del error
-             await context.bot.send_message(
-                 chat_id=user_chat_id,
-                 text=f"❌ No se pudo descargar el contenido de este link.\n\nPosibles razones:\n• Contenido privado o restringido\n• Link inválido\n• Plataforma no soportada"
-             )
-
-    except Exception as e:
-        logger.error(f"❌ Error en handle_url: {e}")
-        # Notificar al usuario del error
-        try:
-            await context.bot.send_message(
-                chat_id=user_chat_id,
-                text=f"❌ Error procesando el link:\n{str(e)[:200]}"
-            )
-        except:
-            pass
-    
-    finally:
-        # Limpieza de todos los archivos descargados
-        if downloaded_files:
-            for file_path in downloaded_files:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"🗑️ Archivo temporal eliminado: {file_path}")
+    # Encolar los trabajos (persistentes, en un solo lote) y despertar a los workers
+    job_ids = download_queue.enqueue_many([url for url, _ in links], user_chat_id)
+    queue_event.set()
+    logger.info(f"📥 Trabajos {', '.join(map(str, job_ids))} en cola ({download_queue.depth()} pendientes)")
 
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -243,6 +188,27 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Error: {context.error}")
 
 
+async def post_init(application: Application):
+    """Arranca las métricas y, si este proceso también descarga, los workers de la cola."""
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if BOT_ROLE == 'ingester':
+        logger.info(f"📮 Modo ingester: los trabajos se publican en la cola ({QUEUE_BACKEND}) para worker.py")
+        return
+    # Proceso único: todo lo que quedó a medias era de este proceso
+    download_queue.recover()
+    download_queue.purge()
+    start_workers(application.bot)
+
+
+async def post_shutdown(application: Application):
+    """Libera recursos al detener el bot."""
+    await album_buffer.flush_all()
+    await stop_workers()
+    if seen_index:
+        seen_index.close()
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja el comando /start: Bienvenida y Chequeo de Estado."""
     user = update.effective_user
@@ -265,13 +231,30 @@ def main():
         logger.error("❌ BOT_TOKEN no configurado. Revisa tu archivo .env")
         return
     
-    # Nota: SOURCE_CHAT_ID ya no es estricto para recibir, pero DESTINATION_CHAT_ID sí es necesario para enviar.
-    if not DESTINATION_CHAT_ID:
-        logger.error("❌ DESTINATION_CHAT_ID no configurado")
+    # Nota: SOURCE_CHAT_ID ya no es estricto para recibir; hace falta un destino o un archivo de rutas.
+    if not DESTINATION_CHAT_ID and not ROUTES_FILE:
+        logger.error("❌ DESTINATION_CHAT_ID (o ROUTES_FILE) no configurado")
         return
     
     # Crear aplicación
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)  # Procesar updates en paralelo (las descargas van al pool)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if LOCAL_BOT_API_URL:
+        # Servidor Bot API propio: archivos por ruta y sin el límite de 50 MB
+        builder = (
+            builder
+            .base_url(LOCAL_BOT_API_BASE_URL)
+            .base_file_url(LOCAL_BOT_API_FILE_URL)
+            .local_mode(True)
+            .read_timeout(LOCAL_BOT_API_TIMEOUT)
+            .write_timeout(LOCAL_BOT_API_TIMEOUT)
+        )
+    application = builder.build()
 
     # Añadir handler para comando /start
     application.add_handler(CommandHandler("start", start_command))
@@ -300,9 +283,76 @@ def main():
     logger.info("🤖 Bot iniciado. Esperando mensajes...")
     logger.info(f"📥 Origen: {SOURCE_CHAT_ID}")
     logger.info(f"📤 Destino: {DESTINATION_CHAT_ID}")
+    if ROUTES_FILE:
+        logger.info(f"🧭 Rutas de reenvío: {ROUTES_FILE} (recarga cada {ROUTES_RELOAD_INTERVAL:g}s)")
+    logger.info(f"📤 Destinos de descargas: {DESTINATION_CHAT_IDS}")
+    logger.info(f"⚙️ Rol: {BOT_ROLE}, cola: {QUEUE_BACKEND}")
+    if LOCAL_BOT_API_URL:
+        logger.info(f"🏠 Servidor Bot API local: {LOCAL_BOT_API_URL}")
+    if BOT_ROLE != 'ingester':
+        logger.info(f"⚙️ Pool de descargas: {DOWNLOAD_WORKERS} workers ({DOWNLOAD_POOL}), {DOWNLOAD_WORKERS_PER_USER} por usuario")
     
     # Ejecutar bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
+
+
+async def run_webhook(application: Application):
+    """Recibe updates por webhook con un servidor HTTP async (con /health y /metrics)."""
+    import signal
+    import secrets
+    from web_server import WebServer
+
+    if not WEBHOOK_URL:
+        logger.error("❌ WEBHOOK_URL no configurado (necesario en BOT_MODE=webhook)")
+        return
+
+    # Sin secret cualquiera podría inyectar updates: se genera uno para esta ejecución
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("⚠️ WEBHOOK_SECRET no configurado: se usa un secret aleatorio (cambia en cada arranque)")
+
+    server = WebServer(
+        application,
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        webhook_path=WEBHOOK_PATH,
+        secret_token=secret_token,
+        health_check=lambda: {
+            'queue_depth': download_queue.depth(),
+            'downloads_in_flight': download_pool.in_flight,
+        }
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # run_webhook/run_polling llaman a post_init/post_shutdown; aquí hay que hacerlo a mano
+    await application.initialize()
+    await post_init(application)
+    try:
+        await server.start()
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=secret_token
+        )
+        await application.start()
+        logger.info(f"🪝 Webhook activo en {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+        await stop_event.wait()
+    finally:
+        logger.info("🛑 Deteniendo bot...")
+        if application.running:
+            await application.stop()
+        await server.stop()
+        await post_shutdown(application)
+        await application.shutdown()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+"""
+Configuración compartida (variables de entorno) del bot y de los workers.
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+def parse_chat_id(val):
+    """Limpia y convierte un ID de chat escrito a mano."""
+    # Limpiar espacios y comillas comunes
+    val = val.strip().strip("'").strip('"')
+    # Corregir error común de doble guión (copy-paste) -> --100... a -100...
+    while val.startswith('--'):
+        val = val[1:]
+    return int(val)
+
+def get_chat_id(env_var):
+    """Obtiene y limpia el ID del chat de las variables de entorno."""
+    val = os.getenv(env_var, '')
+    if not val:
+        return None
+    return parse_chat_id(val)
+
+def get_chat_ids(env_var):
+    """Obtiene una lista de IDs de chat separados por comas."""
+    val = os.getenv(env_var, '')
+    return [parse_chat_id(v) for v in val.split(',') if v.strip().strip("'").strip('"')]
+
+def get_bool(env_var, default='false'):
+    """Interpreta una variable de entorno como booleano."""
+    return os.getenv(env_var, default).strip().lower() in ('1', 'true', 'yes')
+
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+
+# Servidor Bot API propio (telegram-bot-api --local), p.ej. http://localhost:8081.
+# Vacío = API en la nube (por defecto). En modo local los archivos se pasan
+# por ruta (el servidor los lee del disco compartido) y el límite es de 2000 MB.
+LOCAL_BOT_API_URL = os.getenv('LOCAL_BOT_API_URL', '').rstrip('/')
+LOCAL_BOT_API_BASE_URL = f"{LOCAL_BOT_API_URL}/bot"
+LOCAL_BOT_API_FILE_URL = f"{LOCAL_BOT_API_URL}/file/bot"
+# El servidor local responde cuando termina de subir el archivo a Telegram
+LOCAL_BOT_API_TIMEOUT = float(os.getenv('LOCAL_BOT_API_TIMEOUT', '600'))
+SOURCE_CHAT_ID = get_chat_id('SOURCE_CHAT_ID')
+DESTINATION_CHAT_ID = get_chat_id('DESTINATION_CHAT_ID')
+
+# Destinos de las descargas por enlace (lista). Por defecto, solo DESTINATION_CHAT_ID.
+DESTINATION_CHAT_IDS = get_chat_ids('DESTINATION_CHAT_IDS') or (
+    [DESTINATION_CHAT_ID] if DESTINATION_CHAT_ID else []
+)
+
+# Rutas de reenvío (handle_media): archivo JSON con varias rutas origen -> destinos
+# (ver routing.py). Sin archivo, todo se reenvía a DESTINATION_CHAT_ID.
+ROUTES_FILE = os.getenv('ROUTES_FILE', '')
+ROUTES_RELOAD_INTERVAL = float(os.getenv('ROUTES_RELOAD_INTERVAL', '5'))
+
+# Segundos que se esperan las partes de un álbum entrante antes de reenviarlo junto
+ALBUM_WINDOW = float(os.getenv('ALBUM_WINDOW', '1.0'))
+
+# Deduplicación de reenvíos (handle_media): no repetir el mismo mensaje o
+# archivo dentro de la ventana indicada (segundos)
+FORWARD_DEDUP = get_bool('FORWARD_DEDUP', 'true')
+SEEN_INDEX_PATH = os.getenv('SEEN_INDEX_PATH', 'data/seen_index.sqlite3')
+SEEN_WINDOW = int(os.getenv('SEEN_WINDOW', str(7 * 24 * 3600)))
+SEEN_BLOOM_CAPACITY = int(os.getenv('SEEN_BLOOM_CAPACITY', '100000'))
+
+# Rol del proceso bot.py:
+#   'all'      -> recibe updates y procesa descargas (un solo proceso)
+#   'ingester' -> solo recibe updates y publica trabajos; las descargas
+#                 las hacen procesos worker.py aparte
+BOT_ROLE = os.getenv('BOT_ROLE', 'all').strip().lower()
+
+# Pool de descargas: las descargas bloqueantes corren fuera del event loop
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+DOWNLOAD_WORKERS_PER_USER = int(os.getenv('DOWNLOAD_WORKERS_PER_USER', '2'))
+DOWNLOAD_POOL = os.getenv('DOWNLOAD_POOL', 'thread').strip().lower()  # 'thread' o 'process'
+
+# Modo streaming: Telegram descarga el media por URL cuando es posible
+# (sin archivos temporales); si falla, se descarga a disco como siempre.
+STREAM_MODE = get_bool('STREAM_MODE')
+
+# Almacenamiento temporal: un directorio por trabajo dentro de DOWNLOADS_DIR.
+# Cada descarga reserva STORAGE_JOB_RESERVE_MB dentro de STORAGE_QUOTA_MB
+# (0 = sin cuota); si no cabe, espera a que termine otra.
+DOWNLOADS_DIR = os.getenv('DOWNLOADS_DIR', 'downloads')
+STORAGE_QUOTA_MB = int(os.getenv('STORAGE_QUOTA_MB', '2048'))
+STORAGE_JOB_RESERVE_MB = int(os.getenv('STORAGE_JOB_RESERVE_MB', '50'))
+# Trabajos pequeños (slideshows, audio) en RAM, p.ej. /dev/shm/telegram-media (vacío = no)
+STORAGE_TMPFS_DIR = os.getenv('STORAGE_TMPFS_DIR', '')
+STORAGE_TMPFS_QUOTA_MB = int(os.getenv('STORAGE_TMPFS_QUOTA_MB', '256'))
+STORAGE_SMALL_JOB_RESERVE_MB = int(os.getenv('STORAGE_SMALL_JOB_RESERVE_MB', '20'))
+# Reaper: borra lo que lleve este tiempo sin tocarse y no sea de un trabajo activo
+STORAGE_ORPHAN_MAX_AGE = int(os.getenv('STORAGE_ORPHAN_MAX_AGE', '3600'))
+STORAGE_REAP_INTERVAL = int(os.getenv('STORAGE_REAP_INTERVAL', '600'))
+
+# Caché de resultados: enlace normalizado -> file_ids ya subidos a Telegram
+MEDIA_CACHE_PATH = os.getenv('MEDIA_CACHE_PATH', 'data/media_cache.sqlite3')
+MEDIA_CACHE_TTL = int(os.getenv('MEDIA_CACHE_TTL', str(30 * 24 * 3600)))
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', '10000'))
+
+# Cola de trabajos: 'sqlite' (local, por defecto) o 'redis' (varios nodos)
+QUEUE_BACKEND = os.getenv('QUEUE_BACKEND', 'sqlite').strip().lower()
+DOWNLOAD_QUEUE_PATH = os.getenv('DOWNLOAD_QUEUE_PATH', 'data/download_queue.sqlite3')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+QUEUE_WORKERS = int(os.getenv('QUEUE_WORKERS', str(DOWNLOAD_WORKERS)))
+QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))
+QUEUE_RETRY_DELAY = float(os.getenv('QUEUE_RETRY_DELAY', '5'))
+# Un trabajo en curso cuyo worker deja de renovar el lease vuelve a la cola
+QUEUE_LEASE_SECONDS = float(os.getenv('QUEUE_LEASE_SECONDS', '120'))
+# Los workers de otros procesos no reciben aviso de trabajos nuevos: sondean la cola
+QUEUE_POLL_INTERVAL = float(os.getenv('QUEUE_POLL_INTERVAL', '2'))
+
+# Modo de recepción de updates: 'polling' (por defecto) o 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # URL pública, p.ej. https://mi-bot.up.railway.app
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))  # Railway define PORT
+
+# Métricas Prometheus (opcional): puerto local para /metrics
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
@@ -0,0 +1,246 @@
+"""
+Envío de media descargado a uno o varios chats.
+
+El archivo se sube UNA sola vez (al primer chat); el resto de destinos
+lo recibe por file_id, en paralelo, sin volver a subir bytes.
+
+Los slideshows de más de 10 fotos se parten en álbumes equilibrados de
+2-10 fotos (11 -> 6+5): los álbumes se preparan (lectura de archivos) en
+paralelo y se envían en orden. Los álbumes ya enviados a un chat se
+registran (AlbumProgress) para que un reintento no los repita.
+
+Con un servidor Bot API local (LOCAL_BOT_API_URL) los archivos no se leen:
+se pasa su ruta y el servidor los toma directamente del disco.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from contextlib import ExitStack
+from telegram import InputMediaPhoto
+from downloader import is_remote_url
+from metrics import timed, UPLOAD_SECONDS
+from send_scheduler import scheduler
+from config import LOCAL_BOT_API_URL
+
+logger = logging.getLogger(__name__)
+
+# Máximo de fotos por álbum (send_media_group); el mínimo es 2
+MEDIA_GROUP_LIMIT = 10
+
+
+class AlbumProgress:
+    """
+    Álbumes (por índice) ya enviados a cada chat. on_sent(chat_id, index)
+    se llama tras cada envío para persistirlo.
+    """
+
+    def __init__(self, sent=None, on_sent=None):
+        self._sent = {chat_id: set(indices) for chat_id, indices in (sent or {}).items()}
+        self.on_sent = on_sent
+
+    def is_sent(self, chat_id, index):
+        return index in self._sent.get(chat_id, ())
+
+    def mark_sent(self, chat_id, index):
+        self._sent.setdefault(chat_id, set()).add(index)
+        if self.on_sent is not None:
+            self.on_sent(chat_id, index)
+
+
+async def send_text(bot, chat_id, text):
+    """Envía un mensaje de texto a través del planificador de envíos."""
+    return await scheduler.call(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text))
+
+
+def extract_file_id(message, media_type):
+    """Obtiene el file_id que Telegram asignó al media de un mensaje enviado."""
+    if message is None:
+        return None
+    if media_type == 'photo' and message.photo:
+        return message.photo[-1].file_id
+    if media_type == 'video' and message.video:
+        return message.video.file_id
+    if media_type == 'audio' and message.audio:
+        return message.audio.file_id
+    return None
+
+
+async def _send(bot, chat_id, media_type, items, caption):
+    """
+    Envía un único item (file object o file_id) según el tipo de media.
+    Devuelve la lista de mensajes enviados.
+    """
+    if media_type == 'video':
+        return [await bot.send_video(chat_id=chat_id, video=items[0], caption=caption, supports_streaming=True)]
+    if media_type == 'audio':
+        return [await bot.send_audio(chat_id=chat_id, audio=items[0], caption=caption)]
+    if media_type == 'photo':
+        return [await bot.send_photo(chat_id=chat_id, photo=items[0], caption=caption)]
+    return []
+
+
+def is_album(media_type, items):
+    """True si los items se envían como álbum (slideshow de fotos)."""
+    return media_type == 'photo' and len(items) > 1
+
+
+def local_path(path):
+    """Ruta absoluta para el servidor Bot API local (la envía como file://)."""
+    return Path(path).resolve()
+
+
+def _build_media_group(items, caption, read_files):
+    """Álbum de fotos (solo la primera con caption). Lee los archivos locales."""
+    media_group = []
+    for i, item in enumerate(items):
+        if read_files and not is_remote_url(item):
+            if LOCAL_BOT_API_URL:
+                item = local_path(item)
+            else:
+                with open(item, 'rb') as f:
+                    item = f.read()
+        media_group.append(InputMediaPhoto(media=item, caption=caption if i == 0 else None))
+    return media_group
+
+
+def split_media_groups(items):
+    """
+    Parte los items en el mínimo de álbumes posible, de tamaños equilibrados
+    (11 -> 6+5, no 10+1: send_media_group exige al menos 2 elementos).
+    """
+    count = -(-len(items) // MEDIA_GROUP_LIMIT)
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+async def prepare_media_groups(items, caption, read_files=False):
+    """Parte los items en álbumes (split_media_groups) y los prepara en paralelo."""
+    chunks = split_media_groups(items)
+    return await asyncio.gather(*(
+        asyncio.to_thread(_build_media_group, chunk, caption if i == 0 else None, read_files)
+        for i, chunk in enumerate(chunks)
+    ))
+
+
+async def send_media_groups(bot, chat_id, media_groups, progress=None):
+    """
+    Envía los álbumes en orden (cada uno se reintenta por separado). Los ya
+    enviados según progress se saltan: sus mensajes quedan como None.
+    """
+    messages = []
+    for index, media_group in enumerate(media_groups):
+        if progress is not None and progress.is_sent(chat_id, index):
+            messages.extend([None] * len(media_group))
+            continue
+        sent = await scheduler.call(
+            chat_id, lambda media_group=media_group: bot.send_media_group(chat_id=chat_id, media=media_group)
+        )
+        if progress is not None:
+            progress.mark_sent(chat_id, index)
+        messages.extend(sent)
+    return messages
+
+
+async def upload_media(bot, chat_id, files, media_type, caption, progress=None):
+    """
+    Sube los archivos a un chat. Devuelve los file_ids asignados (None en
+    los álbumes que ya se habían enviado antes).
+    Las URLs remotas (modo streaming) se pasan tal cual: Telegram las descarga.
+    """
+    async def attempt():
+        # Abrir los archivos en cada intento (un reintento no puede reusar handles leídos)
+        with ExitStack() as stack:
+            items = [
+                f if is_remote_url(f)
+                else local_path(f) if LOCAL_BOT_API_URL
+                else stack.enter_context(open(f, 'rb'))
+                for f in files[:1]
+            ]
+            return await _send(bot, chat_id, media_type, items, caption)
+
+    if any(is_remote_url(f) for f in files):
+        mode = 'url'
+    else:
+        mode = 'local' if LOCAL_BOT_API_URL else 'upload'
+    with timed(UPLOAD_SECONDS, media_type=media_type, mode=mode):
+        if is_album(media_type, files):
+            media_groups = await prepare_media_groups(files, caption, read_files=True)
+            messages = await send_media_groups(bot, chat_id, media_groups, progress)
+        else:
+            messages = await scheduler.call(chat_id, attempt)
+    logger.info(f"✅ {len(messages)} archivo(s) ({media_type}) subidos a {chat_id}")
+    return [extract_file_id(m, media_type) for m in messages]
+
+
+async def send_cached_media(bot, chat_id, media_type, file_ids, caption, progress=None):
+    """Reenvía media ya subido a Telegram por file_id (sin descargar ni subir)."""
+    with timed(UPLOAD_SECONDS, media_type=media_type, mode='file_id'):
+        if is_album(media_type, file_ids):
+            await send_media_groups(bot, chat_id, await prepare_media_groups(file_ids, caption), progress)
+        else:
+            await scheduler.call(chat_id, lambda: _send(bot, chat_id, media_type, file_ids, caption))
+    logger.info(f"✅ {media_type} enviado por file_id a {chat_id}")
+
+
+async def fan_out_cached(bot, chat_ids, media_type, file_ids, caption, progress=None):
+    """Envía por file_id a todos los chats en paralelo. Devuelve {chat_id: éxito}."""
+    results = await asyncio.gather(
+        *(send_cached_media(bot, chat_id, media_type, file_ids, caption, progress) for chat_id in chat_ids),
+        return_exceptions=True
+    )
+    status = {}
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Error enviando por file_id a {chat_id}: {result}")
+        status[chat_id] = not isinstance(result, Exception)
+    return status
+
+
+async def deliver_media(bot, chat_ids, files, media_type, caption, progress=None):
+    """
+    Sube el media una vez y lo distribuye al resto de chats por file_id.
+    Devuelve (file_ids, {chat_id: éxito}).
+    """
+    status = {chat_id: False for chat_id in chat_ids}
+    file_ids = None
+    pending = list(chat_ids)
+
+    # 1. Subir al primer chat que lo acepte
+    while pending:
+        chat_id = pending.pop(0)
+        try:
+            file_ids = await upload_media(bot, chat_id, files, media_type, caption, progress)
+            status[chat_id] = True
+            break
+        except Exception as e:
+            logger.error(f"❌ Error enviando archivo a {chat_id}: {e}")
+            if any(is_remote_url(f) for f in files):
+                # Telegram no pudo bajar la URL: fallará igual en los demás chats
+                return file_ids, status
+
+    if not pending:
+        return file_ids, status
+
+    # 2. Resto de destinos por referencia (o re-subida si no hay file_id)
+    if file_ids and all(file_ids):
+        status.update(await fan_out_cached(bot, pending, media_type, file_ids, caption, progress))
+    else:
+        results = await asyncio.gather(
+            *(upload_media(bot, chat_id, files, media_type, caption, progress) for chat_id in pending),
+            return_exceptions=True
+        )
+        for chat_id, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Error enviando archivo a {chat_id}: {result}")
+            else:
+                status[chat_id] = True
+                file_ids = file_ids if file_ids and all(file_ids) else result
+
+    return file_ids, status
@@ -0,0 +1,91 @@
+"""
+Pool de trabajadores para ejecutar descargas fuera del event loop.
+
+Las descargas (yt-dlp, httpx, instaloader) son síncronas y bloqueantes,
+así que se ejecutan en un pool de hilos o de procesos con un límite
+global de concurrencia y otro límite por usuario.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _noop():
+    pass
+
+
+class DownloadPool:
+    """Ejecuta funciones bloqueantes en un pool acotado (global y por usuario)."""
+
+    def __init__(self, max_workers=4, per_user_limit=2, use_processes=False, initializer=None):
+        self.max_workers = max(1, max_workers)
+        self.per_user_limit = max(1, per_user_limit)
+        self.use_processes = use_processes
+
+        # initializer: se ejecuta en cada hilo/proceso al crearlo (precalentamiento)
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=initializer)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='download',
+                initializer=initializer
+            )
+
+        self._global = asyncio.Semaphore(self.max_workers)
+        # user_id -> [Semaphore, usuarios esperando/ejecutando]
+        self._per_user = {}
+        self.in_flight = 0
+
+    def _acquire_user_slot(self, user_id):
+        """Obtiene (o crea) el semáforo del usuario y registra su uso."""
+        entry = self._per_user.get(user_id)
+        if entry is None:
+            entry = [asyncio.Semaphore(self.per_user_limit), 0]
+            self._per_user[user_id] = entry
+        entry[1] += 1
+        return entry
+
+    def _release_user_slot(self, user_id, entry):
+        """Libera el registro del usuario cuando ya no tiene tareas."""
+        entry[1] -= 1
+        if entry[1] <= 0:
+            self._per_user.pop(user_id, None)
+
+    def busy_users(self):
+        """Usuarios que ya tienen ocupado todo su cupo de descargas."""
+        return {
+            user_id for user_id, (_, count) in self._per_user.items()
+            if count >= self.per_user_limit
+        }
+
+    async def run(self, user_id, func, *args):
+        """
+        Ejecuta func(*args) en el pool respetando los límites de concurrencia.
+        El event loop sigue atendiendo otros updates mientras tanto.
+        """
+        entry = self._acquire_user_slot(user_id)
+        try:
+            async with entry[0]:
+                async with self._global:
+                    self.in_flight += 1
+                    try:
+                        loop = asyncio.get_running_loop()
+                        return await loop.run_in_executor(self._executor, func, *args)
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            self._release_user_slot(user_id, entry)
+
+    def warm_up(self):
+        """Arranca los hilos/procesos del pool ya, en lugar de en la primera descarga."""
+        for _ in range(self.max_workers):
+            self._executor.submit(_noop)
+
+    def shutdown(self):
+        """Cierra el pool sin esperar tareas pendientes."""
+        logger.info("🛑 Cerrando pool de descargas...")
+        self._executor.shutdown(wait=False, cancel_futures=True)
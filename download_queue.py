@@ -0,0 +1,315 @@
+"""
+Cola persistente de trabajos de descarga (SQLite en modo WAL).
+
+Cada enlace recibido se guarda como un trabajo antes de procesarse, así
+que un reinicio o un redeploy no pierde peticiones: al arrancar, los
+trabajos que quedaron a medias vuelven a la cola.
+
+La misma base de datos puede compartirse entre varios procesos del mismo
+host (bot.py en modo ingester + procesos worker.py). Cada trabajo tomado
+tiene un lease que el worker renueva mientras lo procesa; si el worker
+muere, el lease vence y otro worker lo vuelve a tomar (entrega
+at-least-once). Los chats a los que ya se envió se guardan en
+'delivered' para no repetir envíos al reintentar; de los slideshows
+partidos en varios álbumes se guarda también cada álbum ya enviado
+('<chat>:<índice>', ver album_key).
+
+Estados: queued -> downloading -> uploading -> done | failed
+"""
+
+import os
+import time
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def album_key(chat_id, index):
+    """Entrada de 'delivered' para un álbum de un slideshow ya enviado a un chat."""
+    return f'{chat_id}:{index}'
+
+
+def parse_delivered_entry(value):
+    """Chat completo (int) o álbum ya enviado ('<chat>:<índice>')."""
+    value = str(value)
+    return value if ':' in value else int(value)
+
+
+def delivered_albums(delivered):
+    """{chat_id: {índices}} de los álbumes ya enviados según 'delivered'."""
+    albums = {}
+    for entry in delivered:
+        if isinstance(entry, str):
+            chat_id, index = entry.rsplit(':', 1)
+            albums.setdefault(int(chat_id), set()).add(int(index))
+    return albums
+
+
+class DownloadQueue:
+    """Cola durable de trabajos con reintentos y backoff exponencial."""
+
+    def __init__(self, path, max_attempts=3, retry_base_delay=5.0, retry_max_delay=300.0,
+                 lease_seconds=120.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # timeout: otros procesos pueden tener la base bloqueada un momento
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                user_chat_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT,
+                lease_until REAL,
+                delivered TEXT NOT NULL DEFAULT '[]'
+            )
+            """
+        )
+        # Migración de colas creadas antes de los leases
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'lease_until' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+        if 'delivered' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN delivered TEXT NOT NULL DEFAULT '[]'")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_state_next_run ON jobs (state, next_run_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job['delivered'] = json.loads(job.get('delivered') or '[]')
+        return job
+
+    def enqueue(self, url, user_chat_id):
+        """Añade un trabajo a la cola. Devuelve su id."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                """
+                INSERT INTO jobs (url, user_chat_id, state, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (url, user_chat_id, QUEUED, now, now, now)
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def enqueue_many(self, urls, user_chat_id):
+        """Añade varios trabajos en una sola transacción. Devuelve sus ids."""
+        now = time.time()
+        job_ids = []
+        with self._lock:
+            for url in urls:
+                cur = self._conn.execute(
+                    """
+                    INSERT INTO jobs (url, user_chat_id, state, next_run_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (url, user_chat_id, QUEUED, now, now, now)
+                )
+                job_ids.append(cur.lastrowid)
+            self._conn.commit()
+        return job_ids
+
+    def claim(self, exclude_users=()):
+        """
+        Toma el trabajo listo más antiguo y lo marca como 'downloading' con
+        un lease. También vuelven a tomarse los trabajos cuyo lease venció
+        (su worker murió a medias).
+        exclude_users: usuarios que no deben recibir más trabajos por ahora.
+        Devuelve el trabajo (dict) o None si no hay ninguno listo.
+        """
+        now = time.time()
+        exclude_users = list(exclude_users)
+        placeholders = ','.join('?' * len(exclude_users))
+        user_filter = f"AND user_chat_id NOT IN ({placeholders})" if exclude_users else ""
+        with self._lock:
+            # BEGIN IMMEDIATE: el SELECT + UPDATE es atómico también entre procesos
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"""
+                    SELECT * FROM jobs
+                    WHERE ((state = ? AND next_run_at <= ?)
+                           OR (state IN (?, ?) AND COALESCE(lease_until, 0) < ?))
+                    {user_filter}
+                    ORDER BY next_run_at, id LIMIT 1
+                    """,
+                    (QUEUED, now, DOWNLOADING, UPLOADING, now, *exclude_users)
+                ).fetchone()
+                if row is None:
+                    self._conn.rollback()
+                    return None
+                if row['state'] != QUEUED:
+                    logger.warning(f"♻️ Trabajo {row['id']} recuperado: lease vencido")
+                self._conn.execute(
+                    """
+                    UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ?, lease_until = ?
+                    WHERE id = ?
+                    """,
+                    (DOWNLOADING, now, now + self.lease_seconds, row['id'])
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            job = self._job(row)
+            job['state'] = DOWNLOADING
+            job['attempts'] += 1
+            return job
+
+    def set_state(self, job_id, state):
+        """Actualiza el estado de un trabajo en curso (y renueva su lease)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ?, lease_until = ? WHERE id = ?",
+                (state, now, now + self.lease_seconds, job_id)
+            )
+            self._conn.commit()
+
+    def heartbeat(self, job_id):
+        """Renueva el lease de un trabajo en curso."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND state IN (?, ?)",
+                (time.time() + self.lease_seconds, job_id, DOWNLOADING, UPLOADING)
+            )
+            self._conn.commit()
+
+    def mark_delivered(self, job_id, chat_ids):
+        """Registra los chats (o álbumes, ver album_key) ya enviados del trabajo."""
+        if not chat_ids:
+            return
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT delivered FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            delivered = set(json.loads(row['delivered'] or '[]')) | set(chat_ids)
+            self._conn.execute(
+                "UPDATE jobs SET delivered = ? WHERE id = ?",
+                (json.dumps(sorted(delivered, key=str)), job_id)
+            )
+            self._conn.commit()
+
+    def complete(self, job_id):
+        """Marca un trabajo como terminado."""
+        self.set_state(job_id, DONE)
+
+    def fail(self, job_id, error, retry=True):
+        """
+        Registra un fallo. Si quedan intentos, reprograma el trabajo con
+        backoff exponencial. Devuelve True si se reintentará.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            attempts = row['attempts'] if row else self.max_attempts
+
+            if retry and attempts < self.max_attempts:
+                delay = min(self.retry_base_delay * (2 ** (attempts - 1)), self.retry_max_delay)
+                self._conn.execute(
+                    """
+                    UPDATE jobs SET state = ?, next_run_at = ?, updated_at = ?, last_error = ?,
+                                    lease_until = NULL
+                    WHERE id = ?
+                    """,
+                    (QUEUED, now + delay, now, str(error)[:500], job_id)
+                )
+                self._conn.commit()
+                logger.warning(f"🔁 Trabajo {job_id} reintentará en {delay:.0f}s (intento {attempts}/{self.max_attempts})")
+                return True
+
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ?, last_error = ? WHERE id = ?",
+                (FAILED, now, str(error)[:500], job_id)
+            )
+            self._conn.commit()
+            return False
+
+    def recover(self, expired_only=False):
+        """
+        Devuelve a la cola los trabajos que quedaron a medias (reinicio/crash).
+        Con expired_only solo los de lease vencido: los demás pueden estar
+        en manos de workers de otros procesos.
+        """
+        now = time.time()
+        lease_filter = "AND COALESCE(lease_until, 0) < ?" if expired_only else ""
+        params = (now,) if expired_only else ()
+        with self._lock:
+            cur = self._conn.execute(
+                f"""
+                UPDATE jobs SET state = ?, next_run_at = ?, updated_at = ?, lease_until = NULL
+                WHERE state IN (?, ?) {lease_filter}
+                """,
+                (QUEUED, now, now, DOWNLOADING, UPLOADING, *params)
+            )
+            self._conn.commit()
+            if cur.rowcount:
+                logger.info(f"♻️ {cur.rowcount} trabajo(s) pendientes recuperados tras reinicio")
+            return cur.rowcount
+
+    def next_run_delay(self):
+        """Segundos hasta el próximo trabajo programado (None si la cola está vacía)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_run_at) AS next_run_at FROM jobs WHERE state = ?", (QUEUED,)
+            ).fetchone()
+        if row is None or row['next_run_at'] is None:
+            return None
+        return max(0.0, row['next_run_at'] - time.time())
+
+    def depth(self):
+        """Número de trabajos pendientes (en cola o en curso)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?, ?)",
+                (QUEUED, DOWNLOADING, UPLOADING)
+            ).fetchone()
+        return row[0]
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Borra trabajos terminados o fallidos más antiguos que older_than segundos."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - older_than)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
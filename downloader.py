@@ -3,11 +3,25 @@ import logging
 import uuid
 import random
 import subprocess
-import httpx
-import yt_dlp
 import json
 import tempfile
 import re
+import time
+import shutil
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from http_client import get_client, run_http, download_to_file
+from ttl_cache import TTLCache
+from strategy_stats import StrategyStats
+from transcoder import prepare_video, ffmpeg_available
+from ytdl_pool import YoutubeDLPool
+from insta_pool import InstaloaderPool, instaloader
+from links import platform_for_url
+from metrics import (
+    timed, URL_RESOLVE_SECONDS, DOWNLOAD_STRATEGY_SECONDS,
+    CACHE_REQUESTS_TOTAL, DOWNLOAD_FAILURES_TOTAL
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,117 +33,395 @@ USER_AGENTS = [
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
 ]
 
-def resolve_tiktok_url(url):
-    """Resuelve links cortos de TikTok (vm.tiktok.com) a su URL final para detectar slideshows."""
-    if 'tiktok.com' not in url:
+# Límites de Telegram para media enviado por URL (Telegram lo descarga por su cuenta)
+TELEGRAM_URL_PHOTO_LIMIT = 5 * 1024 * 1024
+TELEGRAM_URL_FILE_LIMIT = 20 * 1024 * 1024
+
+# Límite de subida de la Bot API: 50 MB en la nube, 2000 MB con un servidor Bot API local
+TELEGRAM_UPLOAD_LIMIT = int(os.getenv(
+    'TELEGRAM_UPLOAD_LIMIT_MB', '2000' if os.getenv('LOCAL_BOT_API_URL') else '50'
+)) * 1024 * 1024
+# Videos de hasta este múltiplo del límite se descargan y recodifican para que quepan;
+# los más grandes se rechazan antes de descargar nada
+REENCODE_MAX_RATIO = float(os.getenv('REENCODE_MAX_RATIO', '3'))
+
+# Espacio libre mínimo en disco antes de descargar a archivos temporales
+MIN_FREE_DISK_MB = int(os.getenv('MIN_FREE_DISK_MB', '200'))
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.webm', '.avi', '.flv')
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.opus', '.ogg', '.wav', '.aac')
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+# Orden adaptativo de estrategias según éxito/latencia recientes
+strategy_stats = StrategyStats(
+    window=int(os.getenv('STRATEGY_WINDOW', '50')),
+    explore_rate=float(os.getenv('STRATEGY_EXPLORE_RATE', '0.1'))
+)
+
+# Descargas simultáneas de imágenes de un mismo slideshow
+SLIDESHOW_CONCURRENCY = int(os.getenv('SLIDESHOW_CONCURRENCY', '8'))
+
+# Caché de links cortos resueltos (vm.tiktok.com/xxx -> URL final)
+RESOLVE_CACHE_TTL = int(os.getenv('RESOLVE_CACHE_TTL', str(24 * 3600)))
+RESOLVE_CACHE_SIZE = int(os.getenv('RESOLVE_CACHE_SIZE', '5000'))
+RESOLVE_CACHE_PATH = os.getenv('RESOLVE_CACHE_PATH') or None  # Opcional: persistir en disco
+
+# Configuración simple y robusta para yt-dlp (común a todas las peticiones)
+YTDLP_BASE_OPTS = {
+    'noplaylist': False,
+    'quiet': True,
+    'no_warnings': True,
+    'geo_bypass': True,
+    'nocheckcertificate': True,
+    'retries': 3,
+    'fragment_retries': 3,
+    'skip_unavailable_fragments': True,
+}
+
+# Instancias YoutubeDL reutilizables (extractores cargados, cookies compartidas)
+ytdl_pool = YoutubeDLPool(
+    YTDLP_BASE_OPTS,
+    size=int(os.getenv('YTDLP_POOL_SIZE', '4')),
+    cookiefile=os.getenv('YTDLP_COOKIE_FILE') or None
+)
+
+# Contextos Instaloader reutilizables y metadatos de posts cacheados por shortcode
+instaloader_pool = InstaloaderPool(
+    size=int(os.getenv('INSTALOADER_POOL_SIZE', '2')),
+    session_user=os.getenv('INSTAGRAM_SESSION_USER') or None,
+    session_file=os.getenv('INSTAGRAM_SESSION_FILE') or None,
+    meta_ttl=int(os.getenv('INSTAGRAM_META_TTL', '3600'))
+)
+_warm_lock = threading.Lock()
+_warmed = False
+
+_resolve_cache = TTLCache(maxsize=RESOLVE_CACHE_SIZE, ttl=RESOLVE_CACHE_TTL, path=RESOLVE_CACHE_PATH)
+# Metadatos del pre-vuelo de probe_download_size, para que la descarga no los vuelva a pedir
+_preflight_cache = TTLCache(maxsize=64, ttl=300)
+_resolve_inflight = {}  # url -> Future (peticiones HEAD en curso)
+
+def is_canonical_tiktok_url(url):
+    """True si la URL ya es la final (/video/ o /photo/) y no hace falta resolverla."""
+    return '/video/' in url or '/photo/' in url
+
+async def resolve_tiktok_url_async(url):
+    """Versión async de resolve_tiktok_url (usa el cliente HTTP compartido)."""
+    if platform_for_url(url) != 'tiktok' or is_canonical_tiktok_url(url):
         return url
+
+    cached = _resolve_cache.get(url)
+    if cached:
+        CACHE_REQUESTS_TOTAL.labels(cache='resolve', result='hit').inc()
+        return cached
+    CACHE_REQUESTS_TOTAL.labels(cache='resolve', result='miss').inc()
+
+    # Si ya hay una resolución en curso para este link, esperar esa misma
+    pending = _resolve_inflight.get(url)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _resolve_inflight[url] = future
     try:
-        # Usar httpx para seguir redirecciones y obtener la URL final
-        with httpx.Client(follow_redirects=True, timeout=10.0) as client:
-            resp = client.head(url)
-            final_url = str(resp.url)
-            if final_url != url:
-                logger.info(f"🔗 URL resuelta: {final_url}")
-            return final_url
+        final_url = await _head_resolve(url)
+        future.set_result(final_url)
+        return final_url
+    except BaseException:
+        future.set_result(url)
+        raise
+    finally:
+        _resolve_inflight.pop(url, None)
+
+async def _head_resolve(url):
+    """Hace la petición HEAD y guarda el resultado en la caché."""
+    try:
+        # Seguir redirecciones y obtener la URL final (conexión reutilizada)
+        with timed(URL_RESOLVE_SECONDS):
+            resp = await get_client().head(url, timeout=10.0)
+        final_url = str(resp.url)
+        if final_url != url:
+            logger.info(f"🔗 URL resuelta: {final_url}")
+        _resolve_cache.set(url, final_url)
+        return final_url
     except Exception as e:
         logger.warning(f"⚠️ No se pudo resolver la URL {url}: {e}")
         return url
 
+def resolve_tiktok_url(url):
+    """Resuelve links cortos de TikTok (vm.tiktok.com) a su URL final para detectar slideshows."""
+    if platform_for_url(url) != 'tiktok' or is_canonical_tiktok_url(url):
+        return url
+    return run_http(resolve_tiktok_url_async(url))
+
+def extract_instagram_shortcode(url):
+    """Extrae el shortcode de un post/reel de Instagram, o None."""
+    match = re.search(r'instagram\.com/(?:[A-Za-z0-9_.]+/)?(?:p|reels?|tv)/([A-Za-z0-9_-]+)', url)
+    return match.group(1) if match else None
+
+def get_media_key(resolved_url):
+    """
+    Clave normalizada de un enlace ya resuelto, para la caché de resultados.
+    TikTok -> id del video/slideshow, Instagram -> shortcode, Spotify -> tipo+id.
+    """
+    platform = platform_for_url(resolved_url)
+    if platform == 'tiktok':
+        match = re.search(r'/(?:video|photo)/(\d+)', resolved_url)
+        if match:
+            return f"tiktok:{match.group(1)}"
+    elif platform == 'instagram':
+        shortcode = extract_instagram_shortcode(resolved_url)
+        if shortcode:
+            return f"instagram:{shortcode}"
+    elif platform == 'spotify':
+        match = re.search(r'spotify\.com/(?:intl-[a-z-]+/)?(track|album|playlist|episode|show)/([A-Za-z0-9]+)', resolved_url)
+        if match:
+            return f"spotify:{match.group(1)}:{match.group(2)}"
+
+    # Fallback: URL sin query ni fragmento (host en minúsculas)
+    parts = urlsplit(resolved_url)
+    return f"url:{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+def resolve_media_key(url):
+    """Resuelve el enlace y devuelve (clave de caché, URL resuelta)."""
+    resolved_url = resolve_tiktok_url(url)
+    return get_media_key(resolved_url), resolved_url
+
+def get_platform(url):
+    """Plataforma del enlace (para métricas y estadísticas)."""
+    return platform_for_url(url) or 'other'
+
+def content_kind(platform, slideshow):
+    """
+    Clave de las estadísticas de estrategias: los videos y los slideshows de
+    TikTok no comparten estrategias útiles (yt-dlp no baja /photo/).
+    """
+    if platform == 'tiktok':
+        return 'tiktok_slideshow' if slideshow else 'tiktok_video'
+    return platform
+
+def _record_strategy(platform, kind, strategy, start, success):
+    """Registra la duración y el resultado de una estrategia de descarga."""
+    latency = time.perf_counter() - start
+    DOWNLOAD_STRATEGY_SECONDS.labels(
+        platform=platform, strategy=strategy, result='ok' if success else 'error'
+    ).observe(latency)
+    strategy_stats.record(kind, strategy, success, latency)
+
+def is_remote_url(path):
+    """True si el 'archivo' es una URL remota (modo streaming) y no un archivo local."""
+    return path.startswith(('http://', 'https://'))
+
+def detect_media_type(path):
+    """Determina el tipo de media a partir de la extensión."""
+    ext = os.path.splitext(urlsplit(path).path if is_remote_url(path) else path)[1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    if ext in AUDIO_EXTENSIONS:
+        return 'audio'
+    if ext in PHOTO_EXTENSIONS:
+        return 'photo'
+    return 'video'
+
+def ensure_disk_space(temp_dir, needed_bytes=0):
+    """Lanza una excepción si no hay espacio suficiente para descargar."""
+    free = shutil.disk_usage(temp_dir).free
+    required = MIN_FREE_DISK_MB * 1024 * 1024 + needed_bytes
+    if free < required:
+        raise Exception(
+            f"Espacio en disco insuficiente: {free // (1024 * 1024)} MB libres, "
+            f"se necesitan {required // (1024 * 1024)} MB"
+        )
+
+class MediaTooLargeError(Exception):
+    """El contenido no cabe en el límite de subida de Telegram."""
+
+
+def estimate_size(info):
+    """Tamaño estimado (bytes) del formato elegido por yt-dlp, o None si no se sabe."""
+    formats = info.get('requested_formats') or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def size_aware_format(format_string):
+    """Prefiere formatos que quepan en el límite de subida (si yt-dlp conoce su tamaño)."""
+    limit = TELEGRAM_UPLOAD_LIMIT
+    return f"{format_string}[filesize<{limit}]/{format_string}[filesize_approx<{limit}]/{format_string}"
+
+
+def check_upload_size(info):
+    """
+    Pre-vuelo: rechaza antes de descargar lo que no podrá subirse ni
+    recodificándolo.
+    """
+    size = estimate_size(info)
+    if not size or size <= TELEGRAM_UPLOAD_LIMIT:
+        return
+    can_reencode = (
+        ffmpeg_available() and info.get('duration') and info.get('vcodec') != 'none'
+        and size <= TELEGRAM_UPLOAD_LIMIT * REENCODE_MAX_RATIO
+    )
+    if not can_reencode:
+        raise MediaTooLargeError(
+            f"El archivo ({size // (1024 * 1024)} MB) supera el límite de "
+            f"{TELEGRAM_UPLOAD_LIMIT // (1024 * 1024)} MB de Telegram"
+        )
+    logger.info(f"📏 {size // (1024 * 1024)} MB: se recodificará para caber en el límite")
+
+
+def fit_for_upload(files, media_type, duration=None):
+    """
+    Prepara los archivos descargados para subirlos (faststart o recodificación
+    de videos) y comprueba el límite. Si algo no cabe, borra los archivos y
+    lanza MediaTooLargeError: nunca se intenta una subida condenada a fallar.
+    Cualquier otro error (ffmpeg, archivo ausente...) se propaga tal cual
+    tras borrar los archivos, para que cuente como fallo reintentable.
+    """
+    local = [f for f in files if not is_remote_url(f)]
+    try:
+        if media_type == 'video':
+            files = [prepare_video(f, TELEGRAM_UPLOAD_LIMIT, duration) if f in local else f for f in files]
+            local = [f for f in files if not is_remote_url(f)]
+        too_large = [f for f in local if os.path.getsize(f) > TELEGRAM_UPLOAD_LIMIT]
+        if too_large:
+            raise MediaTooLargeError(
+                f"El archivo ({os.path.getsize(too_large[0]) // (1024 * 1024)} MB) supera el límite de "
+                f"{TELEGRAM_UPLOAD_LIMIT // (1024 * 1024)} MB de Telegram"
+            )
+    except BaseException:
+        for f in local:
+            if os.path.exists(f):
+                os.remove(f)
+        raise
+    return files
+
 def is_tiktok_slideshow(url):
     """Detecta si es un slideshow de TikTok basándose en la URL final."""
-    return 'tiktok.com' in url and '/photo/' in url
+    return platform_for_url(url) == 'tiktok' and '/photo/' in url
 
-def download_tiktok_slideshow_tikwm(url, temp_dir, unique_id):
-    """Descarga slideshow TikTok usando la API de TikWM."""
+async def download_tiktok_slideshow_tikwm_async(url, temp_dir, unique_id, streaming=False):
+    """
+    Versión async de download_tiktok_slideshow_tikwm: imágenes en paralelo.
+    En modo streaming devuelve las URLs de las imágenes sin descargarlas.
+    """
     logger.info("🖼️ Usando API TikWM para obtener imágenes del slideshow...")
     api_url = f"https://www.tikwm.com/api/?url={url}"
     
     try:
-        with httpx.Client(timeout=20.0, follow_redirects=True) as client:
-            resp = client.get(api_url)
-            data = resp.json()
-            
-            if data.get('code') != 0:
-                raise Exception(f"TikWM Error: {data.get('msg')}")
-                
-            media_data = data.get('data', {})
-            images = media_data.get('images', [])
-            title = media_data.get('title', 'TikTok Slideshow')
+        resp = await get_client().get(api_url)
+        data = resp.json()
+        
+        if data.get('code') != 0:
+            raise Exception(f"TikWM Error: {data.get('msg')}")
             
-            if not images:
-                # Si no hay imágenes en el campo 'images', TikWM a veces devuelve un solo video
-                logger.warning("⚠️ No se encontraron imágenes en el slideshow de TikWM.")
-                return None, None
-
-            downloaded_files = []
-            for i, img_url in enumerate(images):
-                # Usar .jpg como extensión segura para Telegram
-                file_path = os.path.join(temp_dir, f"{unique_id}_{i}.jpg")
-                
+        media_data = data.get('data', {})
+        images = media_data.get('images', [])
+        title = media_data.get('title', 'TikTok Slideshow')
+        
+        if not images:
+            # Si no hay imágenes en el campo 'images', TikWM a veces devuelve un solo video
+            logger.warning("⚠️ No se encontraron imágenes en el slideshow de TikWM.")
+            return None, None
+
+        if streaming:
+            # Telegram descarga cada imagen directamente desde TikWM
+            logger.info(f"📡 Streaming: {len(images)} imágenes se enviarán por URL")
+            return list(images), title
+
+        ensure_disk_space(temp_dir)
+        semaphore = asyncio.Semaphore(SLIDESHOW_CONCURRENCY)
+
+        async def fetch_image(i, img_url):
+            # Usar .jpg como extensión segura para Telegram
+            file_path = os.path.join(temp_dir, f"{unique_id}_{i}.jpg")
+            async with semaphore:
                 logger.debug(f"⬇️ Bajando imagen {i+1}/{len(images)}")
-                r = client.get(img_url)
-                if r.status_code == 200:
-                    with open(file_path, 'wb') as f:
-                        f.write(r.content)
-                    downloaded_files.append(file_path)
+                try:
+                    return await download_to_file(img_url, file_path)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo bajar la imagen {i+1}: {e}")
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                    return None
+
+        # Todas las imágenes a la vez; gather conserva el orden original
+        results = await asyncio.gather(*(fetch_image(i, img) for i, img in enumerate(images)))
+        downloaded_files = [f for f in results if f]
+        
+        if not downloaded_files:
+            raise Exception("No se pudo descargar ninguna imagen")
             
-            if not downloaded_files:
-                raise Exception("No se pudo descargar ninguna imagen")
-                
-            logger.info(f"✅ Descargadas {len(downloaded_files)} imágenes vía TikWM")
-            return downloaded_files, title
+        logger.info(f"✅ Descargadas {len(downloaded_files)} imágenes vía TikWM")
+        return downloaded_files, title
             
     except Exception as e:
         logger.error(f"❌ Error en TikWM: {e}")
         raise e
 
+def download_tiktok_slideshow_tikwm(url, temp_dir, unique_id, streaming=False):
+    """Descarga slideshow TikTok usando la API de TikWM."""
+    return run_http(download_tiktok_slideshow_tikwm_async(url, temp_dir, unique_id, streaming))
+
+async def download_instagram_items_async(items, temp_dir, unique_id):
+    """Descarga los elementos de un post (o carrusel) en paralelo, en orden."""
+    semaphore = asyncio.Semaphore(SLIDESHOW_CONCURRENCY)
+
+    async def fetch_item(i, item):
+        ext = 'mp4' if item['is_video'] else 'jpg'
+        file_path = os.path.join(temp_dir, f"{unique_id}_{i + 1}.{ext}")
+        async with semaphore:
+            try:
+                return await download_to_file(item['url'], file_path)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo bajar el elemento {i + 1} de Instagram: {e}")
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                return None
+
+    results = await asyncio.gather(*(fetch_item(i, item) for i, item in enumerate(items)))
+    return [f for f in results if f]
+
 def download_instagram_via_instaloader(url, temp_dir, unique_id):
     """
-    Descarga media de Instagram usando instaloader (sin login)
-    para saltar el bloqueo de contenido sensible.
+    Descarga media de Instagram usando instaloader (sin login, o con la
+    sesión del pool) para saltar el bloqueo de contenido sensible.
+    Los metadatos se cachean por shortcode y los elementos de un carrusel
+    se bajan en paralelo con el cliente HTTP compartido.
     """
     logger.info("📸 Usando Instaloader para Instagram (Sensitive Content Bypass)...")
     
     try:
-        import instaloader
-        
+        if instaloader is None:
+            raise ImportError("instaloader")
+
         # Extraer el shortcode de la URL
-        match = re.search(r'/p/([A-Za-z0-9_-]+)', url)
-        if not match:
+        shortcode = extract_instagram_shortcode(url)
+        if not shortcode:
             logger.error("⚠️ No se pudo extraer el shortcode de la URL")
             return None, None
             
-        shortcode = match.group(1)
         logger.info(f"📌 Shortcode detectado: {shortcode}")
         
-        # Crear instancia de Instaloader sin login
-        L = instaloader.Instaloader(
-            download_videos=True,
-            download_video_thumbnails=False,
-            download_geotags=False,
-            download_comments=False,
-            save_metadata=False,
-            compress_json=False,
-            dirname_pattern=temp_dir,
-            filename_pattern=f"{unique_id}_{{counter}}"
-        )
-        
-        # Obtener el post por shortcode
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        
-        # Descargar el post
-        L.download_post(post, target=temp_dir)
-        
-        # Buscar archivos descargados
-        downloaded_files = []
-        for f in sorted(os.listdir(temp_dir)):
-            if f.startswith(unique_id):
-                # Filtrar solo imágenes y videos
-                if f.endswith(('.jpg', '.jpeg', '.png', '.mp4', '.mov')):
-                    downloaded_files.append(os.path.join(temp_dir, f))
+        ensure_disk_space(temp_dir)
+        meta = instaloader_pool.post_metadata(shortcode)
+        downloaded_files = run_http(download_instagram_items_async(meta['items'], temp_dir, unique_id))
+        if len(downloaded_files) < len(meta['items']):
+            # Las URLs firmadas del CDN pueden haber caducado: pedir metadatos frescos
+            logger.info("🔄 Reintentando con metadatos frescos de Instagram...")
+            for f in downloaded_files:
+                os.remove(f)
+            meta = instaloader_pool.post_metadata(shortcode, refresh=True)
+            downloaded_files = run_http(download_instagram_items_async(meta['items'], temp_dir, unique_id))
         
         if downloaded_files:
-            title = post.caption[:100] if post.caption else "Instagram Media"
+            title = meta['caption'][:100] if meta['caption'] else "Instagram Media"
             logger.info(f"✅ Descargado vía Instaloader: {len(downloaded_files)} archivos")
             return downloaded_files, title
         else:
@@ -146,27 +438,112 @@ def download_instagram_via_instaloader(url, temp_dir, unique_id):
         logger.error(f"❌ Error inesperado en Instaloader: {e}")
         return None, None
 
-def download_media(url):
+def warm_up():
+    """
+    Precalienta el downloader (una vez por proceso): crea las instancias de
+    yt-dlp y carga los extractores de las plataformas soportadas.
+    """
+    global _warmed
+    with _warm_lock:
+        if _warmed:
+            return
+        _warmed = True
+    try:
+        ytdl_pool.warm_up(('TikTok', 'Instagram', 'Generic'))
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precalentar yt-dlp: {e}")
+    try:
+        instaloader_pool.warm_up()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precalentar Instaloader: {e}")
+
+def probe_direct_media(request_opts, url):
+    """
+    Modo streaming: consulta yt-dlp sin descargar y, si el formato elegido
+    es un único archivo HTTP que Telegram puede bajar por URL, lo devuelve
+    como ([url_directa], media_type, title). Si no, devuelve None.
+    """
+    # Solo formatos progresivos por HTTP (sin fusión de audio/video ni HLS)
+    format_string = 'best[ext=mp4][protocol^=http]/best[protocol^=http]'
+
+    try:
+        with ytdl_pool.acquire(**request_opts, format=format_string) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        logger.debug(f"Streaming no disponible para {url[:50]}: {e}")
+        return None
+
+    if not info or 'entries' in info or info.get('requested_formats'):
+        return None
+
+    direct_url = info.get('url')
+    size = info.get('filesize') or info.get('filesize_approx')
+    if not direct_url or not size:
+        return None
+
+    media_type = detect_media_type(f"file.{info.get('ext', 'mp4')}")
+    limit = TELEGRAM_URL_PHOTO_LIMIT if media_type == 'photo' else TELEGRAM_URL_FILE_LIMIT
+    if size > limit:
+        return None
+
+    logger.info(f"📡 Streaming: {media_type} ({size // 1024} KB) se enviará por URL directa")
+    return [direct_url], media_type, info.get('title', 'Media')
+
+def default_strategies(platform, slideshow):
+    """Cadena de estrategias por defecto (orden original, antes de reordenar)."""
+    strategies = ['tikwm'] if slideshow else []
+    strategies += ['ytdlp_best', 'ytdlp_worst']
+    if platform == 'instagram':
+        strategies.append('instaloader')
+    return strategies
+
+def probe_download_size(url):
+    """
+    Pre-vuelo para reservar espacio (storage.py): tamaño estimado (bytes) de
+    lo que descargará yt-dlp, o None si no se sabe. Los metadatos quedan
+    guardados un momento y download_media los reutiliza.
+
+    Solo se consulta si yt-dlp (mejor formato) va primero en la cadena: si
+    otra estrategia lo adelanta, el pre-vuelo sería una extracción de más.
+    """
+    platform = get_platform(url)
+    slideshow = is_tiktok_slideshow(url)
+    chain = strategy_stats.order(content_kind(platform, slideshow), default_strategies(platform, slideshow))
+    if chain[0] != 'ytdlp_best':
+        return None
+    options = {'user_agent': random.choice(USER_AGENTS), 'referer': 'https://www.google.com/'}
+    try:
+        with ytdl_pool.acquire(**options, format=size_aware_format('best')) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        logger.debug(f"Pre-vuelo no disponible para {url[:50]}: {e}")
+        return None
+    if not info or 'entries' in info:
+        return None
+    _preflight_cache.set(url, info)
+    return estimate_size(info)
+
+def download_media(url, streaming=False, temp_dir="downloads"):
     """
     Descarga video/audio/fotos desde TikTok, Instagram y Spotify.
+
+    Con streaming=True intenta primero devolver URLs remotas que Telegram
+    descarga por su cuenta (sin pasar por el disco ni la memoria del bot);
+    solo descarga a archivos temporales cuando no es posible.
+
+    temp_dir es el directorio del trabajo (ver storage.py): solo contiene
+    sus archivos, así que buscarlos no depende del resto de descargas.
     """
     
-    temp_dir = "downloads"
     os.makedirs(temp_dir, exist_ok=True)
     
     unique_id = str(uuid.uuid4())
     
     # NUEVO: Resolver URL primero para detectar slideshows en links cortos
     resolved_url = resolve_tiktok_url(url)
-    
-    # Intentar con TikWM para slideshows de TikTok
-    if is_tiktok_slideshow(resolved_url):
-        try:
-            downloaded_files, title = download_tiktok_slideshow_tikwm(resolved_url, temp_dir, unique_id)
-            if downloaded_files:
-                return downloaded_files, 'photo', title
-        except Exception as e:
-            logger.warning(f"⚠️ TikWM falló, reintentando con yt-dlp como fallback: {e}")
+    platform = get_platform(resolved_url)
+    slideshow = is_tiktok_slideshow(resolved_url)
+    kind = content_kind(platform, slideshow)
     
     # Fallback a yt-dlp para todo lo demás (videos TikTok, IG, Spotify)
     url_to_download = resolved_url
@@ -174,32 +551,50 @@ def download_media(url):
     # Template para yt-dlp (múltiples imágenes con numeración)
     output_template = f"{temp_dir}/{unique_id}_%(autonumber)s.%(ext)s"
 
-    # Configuración simple y robusta para yt-dlp
-    ydl_opts = {
+    # Opciones de esta petición (se aplican sobre instancias del pool)
+    request_opts = {
         'outtmpl': output_template,
-        'noplaylist': False,
-        'quiet': True,
-        'no_warnings': True,
-        'geo_bypass': True,
-        'nocheckcertificate': True,
         'user_agent': random.choice(USER_AGENTS),
         'referer': 'https://www.google.com/',
-        'retries': 3,
-        'fragment_retries': 3,
-        'skip_unavailable_fragments': True,
     }
 
-    # Formato simple para todas las plataformas soportadas
-    format_strategies = ['best', 'worst']
+    # Modo streaming: enviar por URL directa si es posible (sin tocar el disco)
+    if streaming:
+        start = time.perf_counter()
+        try:
+            if slideshow:
+                files, title = download_tiktok_slideshow_tikwm(resolved_url, temp_dir, unique_id, streaming=True)
+                result = (files, 'photo', title) if files else None
+            else:
+                result = probe_direct_media(request_opts, url_to_download)
+        except Exception as e:
+            logger.warning(f"⚠️ Streaming no disponible, descargando a disco: {e}")
+            result = None
+        # Clave propia: no mezclar los resultados del streaming con los de la descarga a disco
+        _record_strategy(platform, kind, 'tikwm_stream' if slideshow else 'stream_probe', start, bool(result))
+        if result:
+            return result
+
+    # Antes de escribir en disco, comprobar que hay espacio
+    ensure_disk_space(temp_dir)
+
+    # Metadatos del último pre-vuelo (duración para recodificar)
+    probe = {}
 
     def attempt_download(format_string):
         """Intenta descargar con un formato específico usando yt-dlp."""
-        opts = ydl_opts.copy()
-        opts['format'] = format_string
-        
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with ytdl_pool.acquire(**request_opts, format=format_string) as ydl:
+            # Pre-vuelo: metadatos y formato elegido sin descargar nada (o los de probe_download_size)
+            info = _preflight_cache.pop(url_to_download) if format_string == size_aware_format('best') else None
+            if info is None:
+                info = ydl.extract_info(url_to_download, download=False)
+            if 'entries' not in info:
+                check_upload_size(info)
+                probe['duration'] = info.get('duration')
+
             logger.info(f"⬇️ Descargando: {url_to_download[:50]}... (formato: {format_string})")
-            info = ydl.extract_info(url_to_download, download=True)
+            # Descargar reutilizando los metadatos (sin volver a extraerlos)
+            info = ydl.process_ie_result(info, download=True)
             
             # Detectar si es un slideshow/playlist (múltiples archivos)
             if 'entries' in info:
@@ -234,57 +629,76 @@ def download_media(url):
                 
                 return [filename], title
 
-    # Intentar descarga con estrategias simples
-    last_error = None
-    for i, format_str in enumerate(format_strategies):
-        try:
-            downloaded_files, title = attempt_download(format_str)
-            
-            if not downloaded_files:
-                continue
-            
-            # Determinar tipo basado en el primer archivo
-            first_file = downloaded_files[0]
-            ext = os.path.splitext(first_file)[1].lower()
-            
-            if ext in ['.mp4', '.mov', '.mkv', '.webm', '.avi', '.flv']:
-                media_type = 'video'
-            elif ext in ['.mp3', '.m4a', '.opus', '.ogg', '.wav', '.aac']:
-                media_type = 'audio'
-            elif ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif']:
-                media_type = 'photo'
-            else:
-                media_type = 'video'
+    def run_tikwm():
+        """Slideshow de TikTok vía API TikWM."""
+        downloaded_files, title = download_tiktok_slideshow_tikwm(resolved_url, temp_dir, unique_id)
+        return downloaded_files, 'photo', title
 
-            logger.info(f"✅ Descarga exitosa: {len(downloaded_files)} archivo(s) ({media_type})")
-            return downloaded_files, media_type, title
+    def run_ytdlp(format_string):
+        downloaded_files, title = attempt_download(format_string)
+        if not downloaded_files:
+            return None, None, None
+        # Determinar tipo basado en el primer archivo
+        return downloaded_files, detect_media_type(downloaded_files[0]), title
 
+    def run_instaloader():
+        """Respaldo para Instagram (contenido sensible que yt-dlp no baja)."""
+        downloaded_files, title = download_instagram_via_instaloader(resolved_url, temp_dir, unique_id)
+        if not downloaded_files:
+            return None, None, None
+        # Determinar tipo
+        ext = os.path.splitext(downloaded_files[0])[1].lower()
+        media_type = 'video' if ext == '.mp4' else 'photo'
+        return downloaded_files, media_type, title
+
+    runners = {
+        'tikwm': run_tikwm,
+        'ytdlp_best': lambda: run_ytdlp(size_aware_format('best')),
+        'ytdlp_worst': lambda: run_ytdlp('worst'),
+        'instaloader': run_instaloader,
+    }
+    strategies = default_strategies(platform, slideshow)
+
+    # Reordenar según el historial reciente de este tipo de contenido
+    chain = strategy_stats.order(kind, strategies)
+    if chain != strategies:
+        logger.info(f"🧭 Orden adaptativo ({kind}): {' → '.join(chain)}")
+
+    last_error = None
+    for i, name in enumerate(chain):
+        start = time.perf_counter()
+        probe.clear()
+        try:
+            downloaded_files, media_type, title = runners[name]()
+            if downloaded_files:
+                downloaded_files = fit_for_upload(downloaded_files, media_type, probe.get('duration'))
+        except MediaTooLargeError as e:
+            # No es un fallo de la estrategia: otra (p.ej. peor calidad) puede caber
+            last_error = e
+            logger.warning(f"📏 Intento {i+1} ({name}): {e}")
+            continue
         except Exception as e:
             error_str = str(e).lower()
             last_error = e
+            _record_strategy(platform, kind, name, start, False)
             
-            logger.warning(f"⚠️ Intento {i+1} falló: {str(e)[:100]}")
+            logger.warning(f"⚠️ Intento {i+1} ({name}) falló: {str(e)[:100]}")
             
             # Cambiar User-Agent si hay bloqueo
             if any(x in error_str for x in ['403', 'forbidden', 'prohibido']):
-                ydl_opts['user_agent'] = random.choice(USER_AGENTS)
-            
+                request_opts['user_agent'] = random.choice(USER_AGENTS)
             continue
 
-    # SI LLEGAMOS AQUÍ, YT-DLP FALLÓ.
-    # NUEVO: Si es Instagram, intentar con Instaloader de respaldo
-    if 'instagram.com' in resolved_url:
-        try:
-            downloaded_files, title = download_instagram_via_instaloader(resolved_url, temp_dir, unique_id)
-            if downloaded_files:
-                # Determinar tipo
-                ext = os.path.splitext(downloaded_files[0])[1].lower()
-                media_type = 'video' if ext == '.mp4' else 'photo'
-                return downloaded_files, media_type, title
-        except Exception as api_err:
-            logger.error(f"❌ El motor de Instaloader también falló: {api_err}")
+        _record_strategy(platform, kind, name, start, bool(downloaded_files))
+        if downloaded_files:
+            logger.info(f"✅ Descarga exitosa ({name}): {len(downloaded_files)} archivo(s) ({media_type})")
+            return downloaded_files, media_type, title
 
     # Si llegamos aquí, todos los intentos fallaron
-    logger.error(f"❌ Error descargando después de {len(format_strategies)} intentos")
+    DOWNLOAD_FAILURES_TOTAL.labels(platform=platform).inc()
+    logger.error(f"❌ Error descargando después de {len(chain)} intentos")
     logger.error(f"Último error: {last_error}")
+    if isinstance(last_error, MediaTooLargeError):
+        # Reintentar no sirve: el trabajo se rechaza con un mensaje claro
+        raise last_error
     return None, None, None
@@ -0,0 +1,109 @@
+"""
+Capa HTTP compartida para el downloader.
+
+Un único httpx.AsyncClient (keep-alive, HTTP/2 si 'h2' está instalado y
+límites de pool) vive en un event loop propio, en un hilo en segundo
+plano. Las funciones síncronas del downloader (que corren en el pool de
+descargas) le envían corrutinas con run_http(), así todas las peticiones
+reutilizan las mismas conexiones TCP/TLS.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', '50')),
+    max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE', '20')),
+    keepalive_expiry=60.0
+)
+HTTP_TIMEOUT = httpx.Timeout(20.0, connect=10.0)
+
+# Tamaño de bloque al escribir descargas en disco
+CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_loop = None
+_client = None
+_pid = None
+
+
+def _get_loop():
+    """Devuelve el loop HTTP del proceso actual, creándolo si hace falta."""
+    global _loop, _client, _pid
+    with _lock:
+        # Tras un fork (pool de procesos) el hilo del loop no existe: recrear
+        if _loop is None or _pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='http-client', daemon=True)
+            thread.start()
+            _loop = loop
+            _client = None
+            _pid = os.getpid()
+        return _loop
+
+
+def get_client():
+    """
+    Cliente compartido. Solo debe usarse desde corrutinas ejecutadas con
+    run_http() (pertenece al loop HTTP).
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=HTTP_LIMITS,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True
+        )
+        logger.info(f"🌐 Cliente HTTP compartido creado (HTTP/2: {'sí' if HTTP2_AVAILABLE else 'no'})")
+    return _client
+
+
+def run_http(coro, timeout=None):
+    """Ejecuta una corrutina en el loop HTTP compartido y espera su resultado."""
+    future = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    return future.result(timeout)
+
+
+async def download_to_file(url, file_path, headers=None):
+    """Descarga url a file_path en bloques (sin cargar todo en memoria)."""
+    client = get_client()
+    async with client.stream('GET', url, headers=headers) as resp:
+        resp.raise_for_status()
+        with open(file_path, 'wb') as f:
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                f.write(chunk)
+    return file_path
+
+
+async def _close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def close():
+    """Cierra el cliente compartido y detiene el loop HTTP."""
+    global _loop
+    with _lock:
+        loop = _loop if _pid == os.getpid() else None
+        _loop = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close(), loop).result(5)
+    except Exception as e:
+        logger.warning(f"⚠️ Error cerrando el cliente HTTP: {e}")
+    loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,130 @@
+"""
+Pool de instancias Instaloader reutilizables y caché de metadatos de posts.
+
+Crear un Instaloader por petición abre una sesión HTTP nueva (sin cookies
+ni keep-alive) y vuelve a pedir los metadatos del post a Instagram, que
+limita con dureza las peticiones anónimas. El pool mantiene contextos
+vivos (opcionalmente con una sesión guardada con `instaloader --login`) y
+los metadatos de cada post (URLs del media, caption, tipo) se guardan por
+shortcode durante un TTL: los reintentos y los enlaces repetidos no
+vuelven a consultar la API.
+
+Instaloader no es thread-safe: cada instancia la usa un solo hilo a la vez.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from ttl_cache import TTLCache
+from metrics import CACHE_REQUESTS_TOTAL
+
+try:
+    import instaloader
+except ImportError:
+    instaloader = None
+
+logger = logging.getLogger(__name__)
+
+
+class InstaloaderPool:
+    """Contextos Instaloader de larga vida y metadatos de posts cacheados."""
+
+    def __init__(self, size=2, max_uses=500, session_user=None, session_file=None,
+                 meta_ttl=3600, meta_maxsize=2000):
+        self.size = size
+        self.max_uses = max_uses
+        self.session_user = session_user
+        self.session_file = session_file
+        self._idle = []
+        self._uses = {}
+        self._lock = threading.Lock()
+        # Las URLs del CDN de Instagram caducan: el TTL debe ser de horas, no días
+        self.metadata = TTLCache(maxsize=meta_maxsize, ttl=meta_ttl)
+
+    def _create(self):
+        if instaloader is None:
+            raise ImportError("instaloader")
+        loader = instaloader.Instaloader(
+            quiet=True,
+            download_videos=True,
+            download_video_thumbnails=False,
+            download_geotags=False,
+            download_comments=False,
+            save_metadata=False,
+            compress_json=False
+        )
+        if self.session_user:
+            try:
+                loader.load_session_from_file(self.session_user, self.session_file)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo cargar la sesión de Instagram de {self.session_user}: {e}")
+        return loader
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._create()
+
+    def _checkin(self, loader):
+        with self._lock:
+            uses = self._uses.get(id(loader), 0) + 1
+            if uses < self.max_uses and len(self._idle) < self.size:
+                self._uses[id(loader)] = uses
+                self._idle.append(loader)
+                return
+            self._uses.pop(id(loader), None)
+        loader.close()
+
+    @contextmanager
+    def acquire(self):
+        """Presta una instancia Instaloader (con su sesión HTTP viva)."""
+        loader = self._checkout()
+        try:
+            yield loader
+        finally:
+            self._checkin(loader)
+
+    def post_metadata(self, shortcode, refresh=False):
+        """
+        Metadatos de un post: {'typename', 'caption', 'items': [{'url', 'is_video'}]}.
+        Con refresh=True se ignora la caché (p.ej. si las URLs ya caducaron).
+        """
+        if not refresh:
+            cached = self.metadata.get(shortcode)
+            if cached:
+                CACHE_REQUESTS_TOTAL.labels(cache='instagram_meta', result='hit').inc()
+                return cached
+        CACHE_REQUESTS_TOTAL.labels(cache='instagram_meta', result='miss').inc()
+
+        with self.acquire() as loader:
+            post = instaloader.Post.from_shortcode(loader.context, shortcode)
+            if post.typename == 'GraphSidecar':
+                items = [
+                    {'url': node.video_url if node.is_video else node.display_url, 'is_video': node.is_video}
+                    for node in post.get_sidecar_nodes()
+                ]
+            else:
+                items = [{'url': post.video_url if post.is_video else post.url, 'is_video': post.is_video}]
+            meta = {'typename': post.typename, 'caption': post.caption or '', 'items': items}
+
+        self.metadata.set(shortcode, meta)
+        return meta
+
+    def warm_up(self):
+        """Crea las instancias de antemano (y carga la sesión si hay)."""
+        if instaloader is None:
+            return
+        instances = [self._checkout() for _ in range(self.size)]
+        for loader in instances:
+            self._checkin(loader)
+        session = f" (sesión de {self.session_user})" if self.session_user else ""
+        logger.info(f"🔥 Pool de Instaloader listo: {len(instances)} instancias{session}")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._uses.clear()
+        for loader in idle:
+            loader.close()
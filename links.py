@@ -0,0 +1,91 @@
+"""
+Extracción de enlaces soportados de un mensaje y clasificación por plataforma.
+
+Los mensajes de Telegram ya traen las URLs marcadas como entidades
+(MessageEntity URL / TEXT_LINK): si las hay, se usan directamente y no se
+recorre el texto. Si no, una única regex precompilada busca las URLs; un
+texto sin '://' ni siquiera llega a la regex.
+
+La plataforma se decide por sufijo del host, etiqueta a etiqueta
+(www.instagram.com -> instagram.com), con una búsqueda en un dict:
+'notinstagram.com' o 'tiktok.com.evil.net' no se aceptan.
+"""
+
+import re
+from urllib.parse import urlsplit
+
+from telegram import MessageEntity
+
+# Sufijo de host -> plataforma (dominios soportados: TikTok, Instagram, Spotify)
+PLATFORM_HOSTS = {
+    'tiktok.com': 'tiktok',
+    'instagram.com': 'instagram',
+    'open.spotify.com': 'spotify',
+}
+
+URL_ENTITY_TYPES = [MessageEntity.URL, MessageEntity.TEXT_LINK]
+
+URL_RE = re.compile(r'https?://[^\s<>"\'`]+', re.IGNORECASE)
+
+# Puntuación que suele quedar pegada al final de un enlace en el texto
+TRAILING_PUNCTUATION = '.,;:!?)]}>\'"»'
+
+
+def platform_for_host(host):
+    """Plataforma de un host (o None si no está soportado)."""
+    host = host.lower().rstrip('.')
+    labels = host.split('.')
+    for i in range(len(labels) - 1):
+        platform = PLATFORM_HOSTS.get('.'.join(labels[i:]))
+        if platform:
+            return platform
+    return None
+
+
+def platform_for_url(url):
+    """Plataforma de una URL (o None si no está soportada)."""
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    return platform_for_host(host) if host else None
+
+
+def _clean(url):
+    url = url.rstrip(TRAILING_PUNCTUATION)
+    # Telegram marca 'tiktok.com/...' como URL aunque no lleve esquema
+    if '://' not in url:
+        url = f'https://{url}'
+    return url
+
+
+def _candidate_urls(message):
+    text = message.text or message.caption or ''
+    entities = message.entities or message.caption_entities
+    if entities:
+        parsed = (message.parse_entities(URL_ENTITY_TYPES) if message.text
+                  else message.parse_caption_entities(URL_ENTITY_TYPES))
+        if parsed:
+            return [entity.url if entity.type == MessageEntity.TEXT_LINK else value
+                    for entity, value in parsed.items()]
+    if '://' not in text:
+        return []
+    return URL_RE.findall(text)
+
+
+def extract_links(message):
+    """
+    Enlaces soportados del mensaje, en orden y sin repetir.
+    Devuelve una lista de (url, plataforma).
+    """
+    links = []
+    seen = set()
+    for url in _candidate_urls(message):
+        url = _clean(url)
+        if url in seen:
+            continue
+        seen.add(url)
+        platform = platform_for_url(url)
+        if platform:
+            links.append((url, platform))
+    return links
@@ -0,0 +1,113 @@
+"""
+Caché persistente de resultados: URL normalizada -> file_ids de Telegram.
+
+Si un enlace ya se descargó y subió antes, se reenvía por file_id sin
+volver a descargar ni subir nada. Usa SQLite (sobrevive a reinicios),
+con expiración por TTL y desalojo LRU.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """Caché SQLite con TTL y desalojo LRU para file_ids de Telegram."""
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media_cache (
+                key TEXT PRIMARY KEY,
+                media_type TEXT NOT NULL,
+                file_ids TEXT NOT NULL,
+                title TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_media_cache_last_used ON media_cache (last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Devuelve (media_type, file_ids, title) o None si no existe o expiró."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT media_type, file_ids, title, created_at FROM media_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            media_type, file_ids, title, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE media_cache SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return media_type, json.loads(file_ids), title
+
+    def put(self, key, media_type, file_ids, title):
+        """Guarda (o reemplaza) el resultado y aplica el desalojo LRU."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO media_cache
+                    (key, media_type, file_ids, title, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, media_type, json.dumps(file_ids), title, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        """Elimina una entrada (p.ej. si Telegram rechaza un file_id)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        """Borra entradas expiradas y las menos usadas si se supera el máximo."""
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM media_cache WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+        if self.max_entries:
+            self._conn.execute(
+                """
+                DELETE FROM media_cache WHERE key IN (
+                    SELECT key FROM media_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,126 @@
+"""
+Métricas Prometheus del pipeline de reenvío y descarga.
+
+Si prometheus_client no está instalado, todas las métricas son no-ops y
+el bot funciona igual. Con el pool de procesos (DOWNLOAD_POOL=process)
+las métricas internas del downloader se registran en los procesos hijos
+y no aparecen en el endpoint; usa el pool de hilos para verlas.
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest, CONTENT_TYPE_LATEST
+    METRICS_AVAILABLE = True
+except ImportError:
+    Counter = Gauge = Histogram = None
+    METRICS_AVAILABLE = False
+
+
+class _NoopMetric:
+    """Sustituto sin efecto cuando prometheus_client no está disponible."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def set_function(self, func):
+        pass
+
+
+def _metric(cls, name, documentation, labelnames=(), **kwargs):
+    if cls is None:
+        return _NoopMetric()
+    return cls(name, documentation, labelnames, **kwargs)
+
+
+# Buckets pensados para descargas/subidas (de decenas de ms a minutos)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+URL_RESOLVE_SECONDS = _metric(
+    Histogram, 'url_resolve_seconds',
+    'Tiempo resolviendo enlaces cortos', buckets=LATENCY_BUCKETS
+)
+DOWNLOAD_STRATEGY_SECONDS = _metric(
+    Histogram, 'download_strategy_seconds',
+    'Tiempo por estrategia de descarga', ('platform', 'strategy', 'result'), buckets=LATENCY_BUCKETS
+)
+UPLOAD_SECONDS = _metric(
+    Histogram, 'upload_seconds',
+    'Tiempo de envío a Telegram por tipo de media', ('media_type', 'mode'), buckets=LATENCY_BUCKETS
+)
+HANDLER_SECONDS = _metric(
+    Histogram, 'handler_seconds',
+    'Latencia de extremo a extremo por handler', ('handler',), buckets=LATENCY_BUCKETS
+)
+FORWARDS_TOTAL = _metric(
+    Counter, 'media_forwards_total',
+    'Reenvíos de media en handle_media por método', ('method',)
+)
+CACHE_REQUESTS_TOTAL = _metric(
+    Counter, 'cache_requests_total',
+    'Consultas a cachés', ('cache', 'result')
+)
+DOWNLOAD_FAILURES_TOTAL = _metric(
+    Counter, 'download_failures_total',
+    'Descargas fallidas por plataforma', ('platform',)
+)
+QUEUE_DEPTH = _metric(
+    Gauge, 'download_queue_depth',
+    'Trabajos pendientes en la cola de descargas'
+)
+DOWNLOADS_IN_FLIGHT = _metric(
+    Gauge, 'downloads_in_flight',
+    'Descargas ejecutándose en el pool'
+)
+STORAGE_RESERVED_BYTES = _metric(
+    Gauge, 'download_storage_reserved_bytes',
+    'Bytes reservados por los trabajos en el almacenamiento temporal', ('tier',)
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Mide la duración del bloque. Si se pasa 'result' como etiqueta, se
+    reemplaza por 'error' cuando el bloque lanza una excepción.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if 'result' in labels:
+            labels['result'] = 'error'
+        raise
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - start)
+
+
+def start_metrics_server(port):
+    """Expone /metrics en un puerto HTTP local."""
+    if not METRICS_AVAILABLE:
+        logger.warning("⚠️ prometheus_client no está instalado: métricas desactivadas")
+        return False
+    start_http_server(port)
+    logger.info(f"📊 Métricas Prometheus en http://0.0.0.0:{port}/metrics")
+    return True
+
+
+def render_metrics():
+    """Devuelve (contenido, content_type) para servir /metrics desde otro servidor."""
+    if not METRICS_AVAILABLE:
+        return b'', 'text/plain'
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,253 @@
+"""
+Cola de trabajos de descarga sobre Redis (QUEUE_BACKEND=redis).
+
+Misma interfaz que DownloadQueue (SQLite), pero compartible entre varias
+máquinas: el bot publica trabajos y los procesos worker.py de cualquier
+nodo los consumen. El cliente se recibe ya creado, así que en pruebas se
+puede usar un sustituto local compatible (p.ej. fakeredis).
+
+Claves (con el prefijo configurado):
+    next_id          contador de ids
+    job:<id>         hash con los datos del trabajo
+    ready            zset id -> next_run_at (trabajos en cola)
+    leases           zset id -> lease_until (trabajos en curso)
+    finished         zset id -> updated_at (done/failed, para purgar)
+    delivered:<id>   set de chats (y álbumes '<chat>:<índice>') ya enviados
+"""
+
+import time
+import logging
+
+from download_queue import QUEUED, DONE, FAILED, parse_delivered_entry
+
+logger = logging.getLogger(__name__)
+
+# Toma atómica de un trabajo: primero devuelve a la cola los leases
+# vencidos y luego reserva el primer trabajo listo de un usuario no excluido.
+_CLAIM_SCRIPT = """
+local ready, leases, prefix = KEYS[1], KEYS[2], ARGV[1]
+local now, lease_until = ARGV[2], ARGV[3]
+local excluded = {}
+for i = 4, #ARGV do excluded[ARGV[i]] = true end
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', leases, '-inf', now)) do
+    redis.call('ZREM', leases, id)
+    redis.call('ZADD', ready, now, id)
+    redis.call('HSET', prefix .. 'job:' .. id, 'state', 'queued')
+end
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', ready, '-inf', now, 'LIMIT', 0, 100)) do
+    local key = prefix .. 'job:' .. id
+    if not excluded[redis.call('HGET', key, 'user_chat_id')] then
+        redis.call('ZREM', ready, id)
+        redis.call('ZADD', leases, lease_until, id)
+        redis.call('HSET', key, 'state', 'downloading', 'updated_at', now)
+        redis.call('HINCRBY', key, 'attempts', 1)
+        return id
+    end
+end
+return false
+"""
+
+
+class RedisDownloadQueue:
+    """Cola durable de trabajos en Redis con leases y reintentos."""
+
+    def __init__(self, client, prefix='tmf:', max_attempts=3, retry_base_delay=5.0,
+                 retry_max_delay=300.0, lease_seconds=120.0):
+        self.client = client
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.lease_seconds = lease_seconds
+        self._ready = f'{prefix}ready'
+        self._leases = f'{prefix}leases'
+        self._finished = f'{prefix}finished'
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Crea la cola conectándose a REDIS_URL (requiere el paquete redis)."""
+        import redis
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _job_key(self, job_id):
+        return f'{self.prefix}job:{job_id}'
+
+    def _delivered_key(self, job_id):
+        return f'{self.prefix}delivered:{job_id}'
+
+    def _load(self, job_id):
+        data = self.client.hgetall(self._job_key(job_id))
+        if not data:
+            return None
+        return {
+            'id': int(job_id),
+            'url': data['url'],
+            'user_chat_id': int(data['user_chat_id']),
+            'state': data['state'],
+            'attempts': int(data.get('attempts', 0)),
+            'next_run_at': float(data['next_run_at']),
+            'created_at': float(data['created_at']),
+            'updated_at': float(data['updated_at']),
+            'last_error': data.get('last_error'),
+            'delivered': sorted(
+                (parse_delivered_entry(c) for c in self.client.smembers(self._delivered_key(job_id))), key=str
+            ),
+        }
+
+    def enqueue(self, url, user_chat_id):
+        """Añade un trabajo a la cola. Devuelve su id."""
+        now = time.time()
+        job_id = self.client.incr(f'{self.prefix}next_id')
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={
+            'url': url,
+            'user_chat_id': user_chat_id,
+            'state': QUEUED,
+            'attempts': 0,
+            'next_run_at': now,
+            'created_at': now,
+            'updated_at': now,
+        })
+        pipe.zadd(self._ready, {job_id: now})
+        pipe.execute()
+        return job_id
+
+    def enqueue_many(self, urls, user_chat_id):
+        """Añade varios trabajos con un solo pipeline. Devuelve sus ids."""
+        urls = list(urls)
+        if not urls:
+            return []
+        now = time.time()
+        last_id = self.client.incrby(f'{self.prefix}next_id', len(urls))
+        job_ids = list(range(last_id - len(urls) + 1, last_id + 1))
+        pipe = self.client.pipeline()
+        for job_id, url in zip(job_ids, urls):
+            pipe.hset(self._job_key(job_id), mapping={
+                'url': url,
+                'user_chat_id': user_chat_id,
+                'state': QUEUED,
+                'attempts': 0,
+                'next_run_at': now,
+                'created_at': now,
+                'updated_at': now,
+            })
+        # Scores crecientes: se procesan en el orden del mensaje
+        pipe.zadd(self._ready, {job_id: now + i * 1e-6 for i, job_id in enumerate(job_ids)})
+        pipe.execute()
+        return job_ids
+
+    def claim(self, exclude_users=()):
+        """
+        Toma el trabajo listo más antiguo (o uno con lease vencido) y lo
+        marca como 'downloading'. Devuelve el trabajo (dict) o None.
+        """
+        now = time.time()
+        job_id = self._claim(
+            keys=[self._ready, self._leases],
+            args=[self.prefix, now, now + self.lease_seconds, *exclude_users]
+        )
+        if not job_id:
+            return None
+        return self._load(job_id)
+
+    def set_state(self, job_id, state):
+        """Actualiza el estado de un trabajo en curso (y renueva su lease)."""
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={'state': state, 'updated_at': now})
+        pipe.zadd(self._leases, {job_id: now + self.lease_seconds}, xx=True)
+        pipe.execute()
+
+    def heartbeat(self, job_id):
+        """Renueva el lease de un trabajo en curso."""
+        self.client.zadd(self._leases, {job_id: time.time() + self.lease_seconds}, xx=True)
+
+    def mark_delivered(self, job_id, chat_ids):
+        """Registra los chats (o álbumes, ver album_key) ya enviados del trabajo."""
+        if chat_ids:
+            self.client.sadd(self._delivered_key(job_id), *chat_ids)
+
+    def _finish(self, job_id, state, error=None):
+        now = time.time()
+        fields = {'state': state, 'updated_at': now}
+        if error is not None:
+            fields['last_error'] = str(error)[:500]
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping=fields)
+        pipe.zrem(self._leases, job_id)
+        pipe.zadd(self._finished, {job_id: now})
+        pipe.execute()
+
+    def complete(self, job_id):
+        """Marca un trabajo como terminado."""
+        self._finish(job_id, DONE)
+
+    def fail(self, job_id, error, retry=True):
+        """
+        Registra un fallo. Si quedan intentos, reprograma el trabajo con
+        backoff exponencial. Devuelve True si se reintentará.
+        """
+        attempts = int(self.client.hget(self._job_key(job_id), 'attempts') or self.max_attempts)
+
+        if retry and attempts < self.max_attempts:
+            now = time.time()
+            delay = min(self.retry_base_delay * (2 ** (attempts - 1)), self.retry_max_delay)
+            pipe = self.client.pipeline()
+            pipe.hset(self._job_key(job_id), mapping={
+                'state': QUEUED,
+                'next_run_at': now + delay,
+                'updated_at': now,
+                'last_error': str(error)[:500],
+            })
+            pipe.zrem(self._leases, job_id)
+            pipe.zadd(self._ready, {job_id: now + delay})
+            pipe.execute()
+            logger.warning(f"🔁 Trabajo {job_id} reintentará en {delay:.0f}s (intento {attempts}/{self.max_attempts})")
+            return True
+
+        self._finish(job_id, FAILED, error)
+        return False
+
+    def recover(self, expired_only=False):
+        """
+        Devuelve a la cola los trabajos que quedaron a medias. Con
+        expired_only solo los de lease vencido.
+        """
+        now = time.time()
+        max_score = now if expired_only else '+inf'
+        job_ids = self.client.zrangebyscore(self._leases, '-inf', max_score)
+        for job_id in job_ids:
+            pipe = self.client.pipeline()
+            pipe.zrem(self._leases, job_id)
+            pipe.zadd(self._ready, {job_id: now})
+            pipe.hset(self._job_key(job_id), mapping={'state': QUEUED, 'next_run_at': now, 'updated_at': now})
+            pipe.execute()
+        if job_ids:
+            logger.info(f"♻️ {len(job_ids)} trabajo(s) pendientes recuperados tras reinicio")
+        return len(job_ids)
+
+    def next_run_delay(self):
+        """Segundos hasta el próximo trabajo programado (None si la cola está vacía)."""
+        first = self.client.zrange(self._ready, 0, 0, withscores=True)
+        if not first:
+            return None
+        return max(0.0, first[0][1] - time.time())
+
+    def depth(self):
+        """Número de trabajos pendientes (en cola o en curso)."""
+        return self.client.zcard(self._ready) + self.client.zcard(self._leases)
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Borra trabajos terminados o fallidos más antiguos que older_than segundos."""
+        job_ids = self.client.zrangebyscore(self._finished, '-inf', time.time() - older_than)
+        for job_id in job_ids:
+            pipe = self.client.pipeline()
+            pipe.delete(self._job_key(job_id), self._delivered_key(job_id))
+            pipe.zrem(self._finished, job_id)
+            pipe.execute()
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,155 @@
+"""
+Tabla de rutas de reenvío (origen -> destinos) para handle_media.
+
+Las rutas se cargan de un archivo JSON (ROUTES_FILE) y se precompilan en
+un dict indexado por (chat de origen, tipo de media): cada update solo
+evalúa las rutas de su origen, sin importar cuántas haya en total. Los
+filtros (tipos, regex del caption, tamaño) se compilan una vez al cargar.
+
+El archivo se vuelve a leer automáticamente cuando cambia (sin reiniciar).
+Si el archivo nuevo es inválido, se mantiene la tabla anterior.
+
+Formato:
+
+    {
+      "routes": [
+        {
+          "name": "memes",
+          "source": -1001234567890,          # o "*" para cualquier chat
+          "destinations": [-1009876543210],
+          "media_types": ["photo", "video"], # opcional (por defecto, todos)
+          "caption_regex": "#meme",          # opcional (sin distinguir mayúsculas)
+          "min_size_mb": 0,                  # opcional
+          "max_size_mb": 50                  # opcional
+        }
+      ]
+    }
+"""
+
+import os
+import re
+import json
+import time
+import logging
+
+from config import parse_chat_id
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = ('photo', 'video', 'document')
+ANY_SOURCE = None
+
+
+class Route:
+    """Una ruta con sus filtros ya compilados."""
+
+    __slots__ = ('name', 'destinations', 'caption_re', 'min_size', 'max_size')
+
+    def __init__(self, name, destinations, caption_regex=None, min_size_mb=None, max_size_mb=None):
+        self.name = name
+        self.destinations = tuple(destinations)
+        self.caption_re = re.compile(caption_regex, re.IGNORECASE) if caption_regex else None
+        self.min_size = int(min_size_mb * 1024 * 1024) if min_size_mb else None
+        self.max_size = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+
+    def matches(self, caption, file_size):
+        if self.caption_re is not None and not self.caption_re.search(caption or ''):
+            return False
+        # Tamaño desconocido: no se filtra por tamaño
+        if file_size is not None:
+            if self.min_size is not None and file_size < self.min_size:
+                return False
+            if self.max_size is not None and file_size > self.max_size:
+                return False
+        return True
+
+
+def _parse_source(value):
+    if value in (None, '*'):
+        return ANY_SOURCE
+    return parse_chat_id(str(value))
+
+
+def build_table(routes):
+    """Precompila la lista de rutas en {(origen, tipo): (Route, ...)}."""
+    table = {}
+    for i, spec in enumerate(routes):
+        destinations = [parse_chat_id(str(d)) for d in spec.get('destinations', [])]
+        if not destinations:
+            raise ValueError(f"La ruta {spec.get('name', i)} no tiene destinos")
+        media_types = spec.get('media_types') or MEDIA_TYPES
+        unknown = set(media_types) - set(MEDIA_TYPES)
+        if unknown:
+            raise ValueError(f"Tipos de media desconocidos en la ruta {spec.get('name', i)}: {unknown}")
+
+        route = Route(
+            spec.get('name', f'ruta{i + 1}'),
+            destinations,
+            caption_regex=spec.get('caption_regex'),
+            min_size_mb=spec.get('min_size_mb'),
+            max_size_mb=spec.get('max_size_mb')
+        )
+        source = _parse_source(spec.get('source', '*'))
+        for media_type in media_types:
+            table.setdefault((source, media_type), []).append(route)
+    return {key: tuple(value) for key, value in table.items()}
+
+
+class Router:
+    """Resuelve los destinos de cada mensaje y recarga ROUTES_FILE si cambia."""
+
+    def __init__(self, path=None, default_routes=(), reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._table = build_table(default_routes)
+        self._mtime = None
+        self._checked_at = 0.0
+        if path:
+            self.reload()
+
+    def reload(self):
+        """Lee el archivo de rutas. Devuelve True si la tabla cambió."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            if self._mtime is None:
+                logger.error(f"❌ No se pudo leer el archivo de rutas {self.path}: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                table = build_table(json.load(f).get('routes', []))
+        except (OSError, ValueError, re.error) as e:
+            logger.error(f"❌ Archivo de rutas inválido ({self.path}), se mantienen las rutas anteriores: {e}")
+            self._mtime = mtime
+            return False
+
+        self._table = table
+        self._mtime = mtime
+        routes = {id(r) for group in table.values() for r in group}
+        logger.info(f"🧭 Rutas cargadas desde {self.path}: {len(routes)} rutas")
+        return True
+
+    def _maybe_reload(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self.reload()
+
+    def destinations(self, chat_id, media_type, caption=None, file_size=None):
+        """Destinos (sin repetir, en orden) para un mensaje de chat_id."""
+        self._maybe_reload()
+        table = self._table
+        candidates = table.get((chat_id, media_type), ()) + table.get((ANY_SOURCE, media_type), ())
+
+        result = []
+        for route in candidates:
+            if route.matches(caption, file_size):
+                for destination in route.destinations:
+                    if destination not in result and destination != chat_id:
+                        result.append(destination)
+        return result
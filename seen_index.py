@@ -0,0 +1,148 @@
+"""
+Índice persistente de media ya reenviado (deduplicación en handle_media).
+
+Guarda las claves de cada reenvío, (chat_id, message_id) y el
+file_unique_id del archivo, en SQLite durante una ventana configurable.
+Delante hay filtros Bloom en memoria: la gran mayoría de mensajes nuevos
+se descartan como "no visto" sin tocar la base de datos, y solo los
+posibles duplicados se confirman con una búsqueda por clave primaria.
+
+Los filtros rotan por generaciones de media ventana (actual + anterior),
+así que la memoria queda acotada aunque el bot lleve meses en marcha.
+"""
+
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Filtro Bloom de tamaño fijo (sin borrado)."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SeenIndex:
+    """Claves vistas en la ventana reciente, persistidas en SQLite."""
+
+    def __init__(self, path, window=7 * 24 * 3600, capacity=100000, error_rate=0.001):
+        self.path = path
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen (
+                key TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_at ON seen (seen_at)")
+        self._conn.commit()
+
+        self._previous = BloomFilter(capacity, error_rate)
+        self._current = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.time()
+        self._load()
+
+    def _load(self):
+        """Purga lo caducado y carga en el filtro las claves de la ventana."""
+        cutoff = time.time() - self.window
+        with self._lock:
+            self._conn.execute("DELETE FROM seen WHERE seen_at < ?", (cutoff,))
+            self._conn.commit()
+            for (key,) in self._conn.execute("SELECT key FROM seen"):
+                self._current.add(key)
+        if self._current.count:
+            logger.info(f"🧮 Índice de reenvíos: {self._current.count} claves recientes cargadas")
+
+    def _rotate_if_needed(self, now):
+        # Cada generación cubre media ventana: entre las dos cubren la ventana
+        # completa. Si se supera 'capacity' solo sube la tasa de falsos
+        # positivos (más confirmaciones en SQLite), nunca se pierden claves.
+        if now - self._rotated_at < self.window / 2:
+            return
+        self._previous = self._current
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._rotated_at = now
+        with self._lock:
+            self._conn.execute("DELETE FROM seen WHERE seen_at < ?", (now - self.window,))
+            self._conn.commit()
+
+    def _maybe_seen(self, key):
+        return key in self._current or key in self._previous
+
+    def check_and_add(self, keys):
+        """
+        Si alguna clave ya se vio dentro de la ventana devuelve True (es un
+        duplicado). Si no, registra todas las claves y devuelve False.
+        """
+        now = time.time()
+        keys = [k for k in keys if k]
+        candidates = [k for k in keys if self._maybe_seen(k)]
+
+        with self._lock:
+            if candidates:
+                # Posible duplicado: confirmar (el filtro puede dar falsos positivos)
+                placeholders = ','.join('?' * len(candidates))
+                row = self._conn.execute(
+                    f"SELECT 1 FROM seen WHERE key IN ({placeholders}) AND seen_at >= ? LIMIT 1",
+                    (*candidates, now - self.window)
+                ).fetchone()
+                if row:
+                    return True
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen (key, seen_at) VALUES (?, ?)",
+                [(k, now) for k in keys]
+            )
+            self._conn.commit()
+
+        self._rotate_if_needed(now)
+        for k in keys:
+            self._current.add(k)
+        return False
+
+    def forget(self, keys):
+        """Olvida claves (p.ej. si el reenvío falló y debe poder repetirse)."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM seen WHERE key = ?", [(k,) for k in keys if k])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
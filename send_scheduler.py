@@ -0,0 +1,231 @@
+"""
+Planificador central de envíos a Telegram.
+
+Todos los envíos pasan por una cola por chat destino (orden garantizado)
+con dos token buckets: uno global y otro por chat, ajustados a los
+límites de Telegram. Si Telegram responde RetryAfter, el chat (y el
+bucket global) se pausan el tiempo indicado y el envío se reintenta, en
+lugar de perder el mensaje.
+
+Los reenvíos consecutivos desde un mismo origen se agrupan en una sola
+llamada forward_messages/copy_messages (hasta 100 mensajes). Un álbum
+se encola como un único reenvío y nunca se parte entre llamadas.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram.error import RetryAfter, NetworkError, TimedOut, BadRequest, Forbidden
+
+logger = logging.getLogger(__name__)
+
+# Máximo de mensajes por llamada a forward_messages/copy_messages
+MAX_FORWARD_BATCH = 100
+
+
+def retry_after_seconds(error):
+    """Segundos de espera indicados por un RetryAfter (int o timedelta)."""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+class TokenBucket:
+    """Token bucket asíncrono con pausa forzada (para RetryAfter)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        """Pausa el bucket durante 'seconds' segundos."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _Item:
+    """Envío pendiente en la cola de un chat."""
+
+    __slots__ = ('kind', 'func', 'bot', 'from_chat_id', 'message_ids', 'future')
+
+    def __init__(self, kind, future, func=None, bot=None, from_chat_id=None, message_ids=()):
+        self.kind = kind
+        self.func = func
+        self.bot = bot
+        self.from_chat_id = from_chat_id
+        self.message_ids = message_ids
+        self.future = future
+
+
+class _ChatQueue:
+    """Cola FIFO de un chat destino y su worker."""
+
+    def __init__(self, bucket):
+        self.items = deque()
+        self.event = asyncio.Event()
+        self.bucket = bucket
+        self.task = None
+
+
+class SendScheduler:
+    """Cola de envíos por chat con límites de ritmo y manejo de flood-wait."""
+
+    def __init__(self, global_rate=30.0, private_rate=1.0, group_rate=20 / 60,
+                 batch_window=0.3, max_retries=3, idle_timeout=60.0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+        self._chats = {}
+
+    def _chat_queue(self, chat_id):
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            # Grupos/canales (IDs negativos) tienen un límite por minuto más estricto
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            queue = _ChatQueue(TokenBucket(rate, max(1.0, rate * 3)))
+            self._chats[chat_id] = queue
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._worker(chat_id, queue))
+        return queue
+
+    def _submit(self, chat_id, item):
+        queue = self._chat_queue(chat_id)
+        queue.items.append(item)
+        queue.event.set()
+        return item.future
+
+    def call(self, chat_id, func):
+        """
+        Encola una llamada a la API. func es una función async sin argumentos
+        que hace la petición (se vuelve a llamar si hay que reintentar).
+        Devuelve un Future con su resultado.
+        """
+        future = asyncio.get_running_loop().create_future()
+        return self._submit(chat_id, _Item('call', future, func=func))
+
+    def forward(self, bot, chat_id, from_chat_id, message_id):
+        """
+        Encola el reenvío de un mensaje (forward con fallback a copy).
+        message_id puede ser una lista (p.ej. las partes de un álbum): se
+        reenvían juntas en la misma llamada.
+        Los reenvíos consecutivos desde el mismo origen se agrupan.
+        El Future devuelve el método usado: 'forward' o 'copy'.
+        """
+        message_ids = tuple(message_id) if isinstance(message_id, (list, tuple)) else (message_id,)
+        future = asyncio.get_running_loop().create_future()
+        item = _Item('forward', future, bot=bot, from_chat_id=from_chat_id, message_ids=message_ids)
+        return self._submit(chat_id, item)
+
+    async def _worker(self, chat_id, queue):
+        """Procesa la cola del chat en orden, agrupando reenvíos consecutivos."""
+        while True:
+            if not queue.items:
+                queue.event.clear()
+                try:
+                    await asyncio.wait_for(queue.event.wait(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if not queue.items:
+                        self._chats.pop(chat_id, None)
+                        return
+                continue
+
+            item = queue.items[0]
+            if item.kind == 'forward' and len(queue.items) < MAX_FORWARD_BATCH and self.batch_window:
+                # Esperar un poco a que llegue el resto de la ráfaga/álbum
+                await asyncio.sleep(self.batch_window)
+
+            batch = [queue.items.popleft()]
+            if item.kind == 'forward':
+                count = len(item.message_ids)
+                while (queue.items and queue.items[0].kind == 'forward'
+                       and queue.items[0].from_chat_id == item.from_chat_id
+                       and count + len(queue.items[0].message_ids) <= MAX_FORWARD_BATCH):
+                    count += len(queue.items[0].message_ids)
+                    batch.append(queue.items.popleft())
+
+            try:
+                result = await self._execute(chat_id, queue.bucket, batch)
+            except Exception as e:
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+                continue
+
+            for entry in batch:
+                if not entry.future.done():
+                    entry.future.set_result(result)
+
+    async def _execute(self, chat_id, bucket, batch):
+        """Ejecuta un envío (o lote) respetando los buckets y reintentando."""
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                if batch[0].kind == 'forward':
+                    return await self._forward_batch(chat_id, batch)
+                return await batch[0].func()
+            except RetryAfter as e:
+                # Flood-wait: pausar este chat y el ritmo global, y reintentar
+                wait = retry_after_seconds(e)
+                logger.warning(f"⏳ Flood limit en {chat_id}: esperando {wait:.0f}s")
+                bucket.block(wait)
+                self.global_bucket.block(min(wait, 1.0))
+            except BadRequest:
+                # Petición inválida: reintentar no sirve de nada
+                raise
+            except (TimedOut, NetworkError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"⚠️ Error de red enviando a {chat_id} (reintento {attempt}): {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _forward_batch(self, chat_id, batch):
+        """
+        Reenvía un lote con forward_messages; si Telegram no permite el reenvío,
+        lo copia con copy_messages. Los errores de red se reintentan fuera: un
+        forward que llegó pero agotó el tiempo no debe copiarse además.
+        """
+        bot = batch[0].bot
+        from_chat_id = batch[0].from_chat_id
+        message_ids = sorted(message_id for entry in batch for message_id in entry.message_ids)
+        try:
+            await bot.forward_messages(chat_id=chat_id, from_chat_id=from_chat_id, message_ids=message_ids)
+            return 'forward'
+        except (BadRequest, Forbidden) as e:
+            # Fallback: copiar contenido (si falla forward por privacidad/permisos)
+            logger.warning(f"⚠️ No se pudo reenviar (Forward) {len(message_ids)} mensaje(s): {e}. Intentando copiar...")
+            await bot.copy_messages(chat_id=chat_id, from_chat_id=from_chat_id, message_ids=message_ids)
+            return 'copy'
+
+
+# Instancia compartida por todo el bot
+scheduler = SendScheduler(
+    global_rate=float(os.getenv('SEND_GLOBAL_RATE', '30')),
+    private_rate=float(os.getenv('SEND_PRIVATE_RATE', '1')),
+    group_rate=float(os.getenv('SEND_GROUP_RATE_PER_MIN', '20')) / 60,
+    batch_window=float(os.getenv('SEND_BATCH_WINDOW', '0.3'))
+)
@@ -0,0 +1,90 @@
+"""
+Coalescencia de descargas en curso (single-flight).
+
+Si varios trabajos piden el mismo contenido a la vez (un enlace viral
+pegado por varios usuarios), solo se lanza una descarga: el resto espera
+su resultado. Cada consumidor mantiene una referencia mientras usa los
+archivos, y estos se limpian cuando termina el último.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from metrics import CACHE_REQUESTS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """Una operación en curso y el número de consumidores que la usan."""
+
+    __slots__ = ('task', 'refs')
+
+    def __init__(self, task):
+        self.task = task
+        self.refs = 0
+
+
+class SingleFlight:
+    """Comparte una misma operación async entre llamadas concurrentes con la misma clave."""
+
+    def __init__(self, cleanup=None):
+        self._cleanup = cleanup
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    @asynccontextmanager
+    async def share(self, key, func):
+        """
+        Devuelve (dentro del bloque) el resultado de func() para la clave.
+        Si ya hay una llamada en curso con la misma clave, se reutiliza.
+        func es una función async sin argumentos. Al salir del último
+        bloque que usa el resultado se llama a cleanup(resultado).
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            CACHE_REQUESTS_TOTAL.labels(cache='inflight', result='miss').inc()
+        else:
+            CACHE_REQUESTS_TOTAL.labels(cache='inflight', result='hit').inc()
+            logger.info(f"🔗 Reutilizando descarga en curso: {key}")
+        flight.refs += 1
+
+        try:
+            # shield: si un consumidor se cancela, la descarga sigue para los demás
+            result = await asyncio.shield(flight.task)
+        except BaseException:
+            if flight.task.done() and self._flights.get(key) is flight:
+                # Falló: los siguientes deben intentarlo de nuevo
+                del self._flights[key]
+            self._release(key, flight)
+            raise
+
+        try:
+            yield result
+        finally:
+            self._release(key, flight)
+
+    def _release(self, key, flight):
+        flight.refs -= 1
+        if flight.refs > 0:
+            return
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done():
+            self._finish(flight.task)
+        else:
+            # Todos los consumidores se fueron antes de que terminara
+            flight.task.add_done_callback(self._finish)
+
+    def _finish(self, task):
+        if self._cleanup is None or task.cancelled() or task.exception() is not None:
+            return
+        try:
+            self._cleanup(task.result())
+        except Exception as e:
+            logger.warning(f"⚠️ Error liberando resultado compartido: {e}")
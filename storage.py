@@ -0,0 +1,227 @@
+"""
+Almacenamiento temporal de las descargas.
+
+Cada trabajo descarga en su propio directorio (downloads/job-<id>/): buscar
+sus archivos cuesta lo que tenga el trabajo, no lo que tenga downloads/, y
+limpiarlo es borrar un directorio. Antes de descargar, cada trabajo reserva
+espacio dentro de una cuota global (control de admisión): si no cabe,
+espera a que otro termine en lugar de llenar el disco. Se reserva el
+tamaño estimado en el pre-vuelo; la reserva fija solo cuando no se conoce.
+
+Opcionalmente, los trabajos pequeños (slideshows, audio) van a un
+directorio en RAM (tmpfs, p.ej. /dev/shm) con su propia cuota.
+
+Un reaper borra lo que quede huérfano (trabajos interrumpidos por un crash
+o un kill a mitad de descarga) al arrancar y periódicamente.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+
+from metrics import STORAGE_RESERVED_BYTES
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = 'job-'
+
+
+def dir_size(path):
+    """Bytes ocupados por los archivos de un directorio (recursivo)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def last_modified(path):
+    """Última modificación de una entrada (para directorios, la más reciente dentro)."""
+    try:
+        latest = os.path.getmtime(path)
+    except OSError:
+        return None
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    pass
+    return latest
+
+
+class JobStorage:
+    """Directorio de un trabajo y el espacio que tiene reservado."""
+
+    __slots__ = ('path', 'tier', 'reserved')
+
+    def __init__(self, path, tier, reserved):
+        self.path = path
+        self.tier = tier
+        self.reserved = reserved
+
+
+class _Tier:
+    """Un directorio raíz (disco o tmpfs) con su cuota."""
+
+    def __init__(self, name, root, quota):
+        self.name = name
+        self.root = root
+        self.quota = quota
+        self.used = 0
+
+    def fits(self, size):
+        # Sin cuota, o sin nada en uso (un trabajo mayor que la cuota no puede esperar para siempre)
+        return not self.quota or not self.used or self.used + size <= self.quota
+
+
+class StorageManager:
+    """Reparte directorios por trabajo con cuota de bytes y reaper de huérfanos."""
+
+    def __init__(self, root='downloads', quota_bytes=0, job_reserve=50 * 1024 * 1024,
+                 tmpfs_root=None, tmpfs_quota=0, small_job_reserve=20 * 1024 * 1024,
+                 orphan_max_age=3600):
+        self.job_reserve = job_reserve
+        self.small_job_reserve = small_job_reserve
+        self.orphan_max_age = orphan_max_age
+        self.disk = _Tier('disk', os.path.abspath(root), quota_bytes)
+        self.tmpfs = _Tier('tmpfs', os.path.abspath(tmpfs_root), tmpfs_quota) if tmpfs_root else None
+        self._jobs = {}  # path -> JobStorage
+        self._freed = None
+        self._reaper_task = None
+
+        for tier in self._tiers():
+            os.makedirs(tier.root, exist_ok=True)
+            STORAGE_RESERVED_BYTES.labels(tier=tier.name).set_function(lambda tier=tier: tier.used)
+
+    @property
+    def limited(self):
+        """True si el disco tiene cuota (merece la pena estimar el tamaño antes)."""
+        return bool(self.disk.quota)
+
+    def _tiers(self):
+        return [self.disk] + ([self.tmpfs] if self.tmpfs else [])
+
+    def _create(self, tier, size):
+        path = os.path.join(tier.root, f"{JOB_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(path)
+        tier.used += size
+        job = JobStorage(path, tier, size)
+        self._jobs[path] = job
+        return job
+
+    async def acquire(self, small=False, estimate=None):
+        """
+        Reserva un directorio para un trabajo. Los pequeños van a tmpfs si
+        hay sitio; si no, al disco. Se reservan 'estimate' bytes (tamaño
+        estimado de la descarga) o, sin estimación, la reserva fija.
+        Espera mientras el disco no tenga cuota libre.
+        """
+        if small and self.tmpfs and self.tmpfs.fits(self.small_job_reserve):
+            return self._create(self.tmpfs, self.small_job_reserve)
+
+        size = estimate or (self.small_job_reserve if small else self.job_reserve)
+        waited = False
+        while not self.disk.fits(size):
+            if not waited:
+                logger.info(
+                    f"💾 Cuota de descargas llena ({self.disk.used // (1024 * 1024)} MB reservados), "
+                    f"esperando espacio..."
+                )
+                waited = True
+            if self._freed is None:
+                self._freed = asyncio.Event()
+            self._freed.clear()
+            await self._freed.wait()
+        return self._create(self.disk, size)
+
+    def _notify(self):
+        """Despierta a los trabajos que esperan espacio."""
+        if self._freed is not None:
+            self._freed.set()
+
+    def settle(self, job):
+        """Ajusta la reserva al tamaño real de lo descargado."""
+        actual = dir_size(job.path)
+        job.tier.used += actual - job.reserved
+        shrunk = actual < job.reserved
+        job.reserved = actual
+        if shrunk:
+            self._notify()
+
+    def release(self, job):
+        """Borra el directorio del trabajo y libera su reserva."""
+        if self._jobs.pop(job.path, None) is None:
+            return
+        shutil.rmtree(job.path, ignore_errors=True)
+        job.tier.used -= job.reserved
+        self._notify()
+        logger.info(f"🗑️ Directorio temporal eliminado: {job.path}")
+
+    def job_for(self, file_path):
+        """Trabajo al que pertenece un archivo descargado (o None)."""
+        return self._jobs.get(os.path.dirname(os.path.abspath(file_path)))
+
+    def reap_orphans(self):
+        """
+        Borra entradas de los directorios raíz que no son de un trabajo activo
+        de este proceso y llevan más de orphan_max_age segundos sin cambios
+        (otros procesos pueden estar usando las más recientes).
+        """
+        cutoff = time.time() - self.orphan_max_age
+        removed = 0
+        freed = 0
+        for tier in self._tiers():
+            try:
+                entries = list(os.scandir(tier.root))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.path in self._jobs:
+                    continue
+                modified = last_modified(entry.path)
+                if modified is None or modified > cutoff:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        freed += dir_size(entry.path)
+                        shutil.rmtree(entry.path)
+                    else:
+                        freed += entry.stat(follow_symlinks=False).st_size
+                        os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"⚠️ No se pudo borrar el huérfano {entry.path}: {e}")
+        if removed:
+            logger.info(f"🧹 Reaper: {removed} huérfano(s) eliminados ({freed // (1024 * 1024)} MB)")
+        return removed
+
+    async def _reap_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reap_orphans)
+            except Exception as e:
+                logger.error(f"❌ Error en el reaper de descargas: {e}")
+
+    def start_reaper(self, interval=600):
+        """Limpia huérfanos ahora y luego cada 'interval' segundos."""
+        self.reap_orphans()
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_forever(interval))
+
+    async def stop_reaper(self):
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
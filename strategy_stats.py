@@ -0,0 +1,88 @@
+"""
+Estadísticas de éxito/latencia por tipo de contenido y estrategia de descarga.
+
+download_media usa StrategyStats para reordenar su cadena de estrategias
+(TikWM, yt-dlp best/worst, Instaloader): primero las que funcionan y son
+rápidas, y al final las que fallan casi siempre. De vez en cuando se
+prueba primero una estrategia descartada (exploración) para detectar
+que se ha recuperado.
+"""
+
+import time
+import random
+import threading
+from collections import deque
+
+# Niveles de prioridad en la cadena
+_TIER_HEALTHY = 0
+_TIER_DEGRADED = 1
+
+
+class StrategyStats:
+    """Ventana deslizante de resultados por (tipo de contenido, estrategia)."""
+
+    def __init__(self, window=50, max_age=3600, min_samples=5,
+                 degraded_below=0.5, skip_below=0.1, explore_rate=0.1):
+        self.window = window
+        self.max_age = max_age
+        self.min_samples = min_samples
+        self.degraded_below = degraded_below
+        self.skip_below = skip_below
+        self.explore_rate = explore_rate
+        self._results = {}  # (kind, strategy) -> deque[(timestamp, success, latency)]
+        self._lock = threading.Lock()
+
+    def record(self, kind, strategy, success, latency):
+        """Registra el resultado de un intento."""
+        with self._lock:
+            results = self._results.setdefault((kind, strategy), deque(maxlen=self.window))
+            results.append((time.time(), bool(success), latency))
+
+    def summary(self, kind, strategy):
+        """Devuelve (tasa de éxito, latencia media de los éxitos, nº de muestras)."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            results = self._results.get((kind, strategy))
+            if not results:
+                return None, None, 0
+            # Descartar resultados demasiado antiguos
+            while results and results[0][0] < cutoff:
+                results.popleft()
+            samples = list(results)
+
+        if not samples:
+            return None, None, 0
+        successes = [latency for _, success, latency in samples if success]
+        rate = len(successes) / len(samples)
+        mean_latency = sum(successes) / len(successes) if successes else None
+        return rate, mean_latency, len(samples)
+
+    def order(self, kind, strategies):
+        """
+        Devuelve la cadena de estrategias reordenada para el tipo de contenido.
+        Sin datos suficientes se respeta el orden original.
+        """
+        ranked = []
+        failing = []
+        for index, strategy in enumerate(strategies):
+            rate, mean_latency, samples = self.summary(kind, strategy)
+            if samples < self.min_samples:
+                ranked.append(((_TIER_HEALTHY, float('inf'), index), strategy))
+            elif rate < self.skip_below:
+                failing.append(strategy)
+            else:
+                tier = _TIER_HEALTHY if rate >= self.degraded_below else _TIER_DEGRADED
+                # Coste esperado hasta un éxito: latencia / probabilidad de éxito
+                expected_cost = (mean_latency or 0.0) / rate
+                ranked.append(((tier, expected_cost, index), strategy))
+
+        chain = [strategy for _, strategy in sorted(ranked)]
+
+        # Exploración: a veces se prueba primero una estrategia descartada
+        if failing and chain and random.random() < self.explore_rate:
+            explored = random.choice(failing)
+            failing.remove(explored)
+            chain.insert(0, explored)
+
+        # Las que fallan casi siempre quedan como último recurso
+        return chain + failing
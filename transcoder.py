@@ -0,0 +1,126 @@
+"""
+Ajuste de videos a los límites de Telegram con ffmpeg.
+
+- faststart: mueve el átomo moov al principio del MP4 (remux sin
+  recodificar) para que supports_streaming=True reproduzca al instante.
+- reencode: recodifica a H.264/AAC con un bitrate calculado para que el
+  archivo quepa en el límite de subida.
+
+Los procesos ffmpeg simultáneos están limitados por FFMPEG_WORKERS para
+que las recodificaciones no se coman toda la CPU.
+"""
+
+import os
+import shutil
+import struct
+import logging
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BIN = shutil.which('ffmpeg')
+FFMPEG_WORKERS = int(os.getenv('FFMPEG_WORKERS', '2'))
+FFMPEG_TIMEOUT = int(os.getenv('FFMPEG_TIMEOUT', '900'))
+
+# Bitrate de audio reservado al recodificar (bits/s)
+AUDIO_BITRATE = 96_000
+# Margen para la sobrecarga del contenedor y la variación del bitrate
+SIZE_MARGIN = 0.92
+
+_slots = threading.BoundedSemaphore(FFMPEG_WORKERS)
+
+
+def ffmpeg_available():
+    return FFMPEG_BIN is not None
+
+
+def is_faststart(path):
+    """True si el moov atom de un MP4 está antes de los datos (mdat)."""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, box = struct.unpack('>I4s', header)
+                if box == b'moov':
+                    return True
+                if box == b'mdat':
+                    return False
+                if size == 1:
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except OSError:
+        return False
+
+
+def _run_ffmpeg(args, src):
+    """
+    Ejecuta ffmpeg (respetando el límite de procesos) y reemplaza src por
+    el resultado en MP4. Devuelve la ruta final.
+    """
+    root, _ = os.path.splitext(src)
+    dst = f"{root}.ffmpeg.mp4"
+    with _slots:
+        result = subprocess.run(
+            [FFMPEG_BIN, '-y', '-loglevel', 'error', '-i', src, *args, dst],
+            capture_output=True, timeout=FFMPEG_TIMEOUT
+        )
+    if result.returncode != 0 or not os.path.exists(dst):
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise Exception(f"ffmpeg falló: {result.stderr.decode(errors='ignore')[-200:]}")
+    final = f"{root}.mp4"
+    os.replace(dst, final)
+    if final != src:
+        os.remove(src)
+    return final
+
+
+def faststart(path):
+    """Remux sin recodificar con el moov atom al principio."""
+    path = _run_ffmpeg(['-c', 'copy', '-movflags', '+faststart'], path)
+    logger.info(f"🎞️ Faststart aplicado: {os.path.basename(path)}")
+    return path
+
+
+def reencode(path, max_bytes, duration):
+    """Recodifica el video para que ocupe como mucho max_bytes."""
+    total_bitrate = max_bytes * 8 * SIZE_MARGIN / duration
+    video_bitrate = int(total_bitrate - AUDIO_BITRATE)
+    if video_bitrate < 100_000:
+        raise Exception("El video es demasiado largo para recodificarlo dentro del límite")
+    path = _run_ffmpeg([
+        '-c:v', 'libx264', '-preset', 'veryfast',
+        '-b:v', str(video_bitrate), '-maxrate', str(video_bitrate), '-bufsize', str(video_bitrate * 2),
+        '-c:a', 'aac', '-b:a', str(AUDIO_BITRATE),
+        '-movflags', '+faststart'
+    ], path)
+    logger.info(f"🎞️ Recodificado a {video_bitrate // 1000} kb/s: {os.path.basename(path)} ({os.path.getsize(path) // 1024} KB)")
+    return path
+
+
+def prepare_video(path, max_bytes, duration=None):
+    """
+    Deja un video listo para Telegram: recodifica si supera max_bytes (hace
+    falta la duración) y si no, aplica faststart cuando falta. Sin ffmpeg
+    no se toca el archivo. Devuelve la ruta final (puede cambiar a .mp4).
+    """
+    if not ffmpeg_available():
+        return path
+    if os.path.getsize(path) > max_bytes:
+        if duration:
+            return reencode(path, max_bytes, duration)
+        return path
+    if path.lower().endswith(('.mp4', '.mov')) and not is_faststart(path):
+        try:
+            return faststart(path)
+        except Exception as e:
+            # No es imprescindible: se envía tal cual
+            logger.warning(f"⚠️ No se pudo aplicar faststart: {e}")
+    return path
@@ -0,0 +1,96 @@
+"""
+Caché LRU en memoria con expiración (TTL), opcionalmente respaldada en disco.
+
+Si se indica 'path', las entradas se guardan también en SQLite y
+sobreviven a reinicios; la memoria actúa como primer nivel.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU con TTL. Los valores deben ser serializables a JSON si hay disco."""
+
+    def __init__(self, maxsize=1024, ttl=3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ttl_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM ttl_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        """Devuelve el valor si existe y no expiró (y lo marca como reciente)."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._data.move_to_end(key)
+                    return value
+                del self._data[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM ttl_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] >= now:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    return value
+
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor con el TTL por defecto (o uno específico)."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ttl_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+                self._conn.commit()
+
+    def pop(self, key, default=None):
+        """Devuelve el valor (si no expiró) y lo elimina."""
+        value = self.get(key, default)
+        with self._lock:
+            self._data.pop(key, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM ttl_cache WHERE key = ?", (key,))
+                self._conn.commit()
+        return value
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,80 @@
+"""
+Servidor HTTP async (aiohttp) para el modo webhook.
+
+Recibe los updates de Telegram en WEBHOOK_PATH (validando el secret
+token, obligatorio) y los mete en la cola de updates de la Application. El mismo
+servidor expone /health y /metrics.
+"""
+
+import hmac
+import json
+import logging
+from aiohttp import web
+from telegram import Update
+
+from metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebServer:
+    """Servidor de webhook + health + métricas."""
+
+    def __init__(self, application, listen='0.0.0.0', port=8080,
+                 webhook_path=None, secret_token=None, health_check=None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        if webhook_path and not secret_token:
+            raise ValueError("El webhook necesita un secret token")
+        self.webhook_path = webhook_path
+        # Se compara en bytes: compare_digest no admite str con caracteres no ASCII
+        self.secret_token = secret_token.encode() if secret_token else None
+        self.health_check = health_check
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/health', self.handle_health)
+        self.app.router.add_get('/metrics', self.handle_metrics)
+        if webhook_path:
+            self.app.router.add_post(webhook_path, self.handle_webhook)
+
+    async def handle_webhook(self, request):
+        """Valida el secret token y encola el update para los handlers."""
+        received = request.headers.get(SECRET_HEADER, '').encode('utf-8', 'surrogateescape')
+        if not hmac.compare_digest(received, self.secret_token):
+            logger.warning("⚠️ Webhook rechazado: secret token inválido")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, ValueError):
+            return web.Response(status=400)
+
+        update = Update.de_json(data, self.application.bot)
+        await self.application.update_queue.put(update)
+        return web.Response(status=200)
+
+    async def handle_health(self, request):
+        """Estado del bot (para health checks del balanceador/Railway)."""
+        details = self.health_check() if self.health_check else {}
+        return web.json_response({'status': 'ok', **details})
+
+    async def handle_metrics(self, request):
+        """Métricas Prometheus."""
+        content, content_type = render_metrics()
+        return web.Response(body=content, headers={'Content-Type': content_type})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"🌐 Servidor HTTP escuchando en {self.listen}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
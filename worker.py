@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Workers de descarga: consumen la cola de trabajos, descargan el contenido
+y lo envían a Telegram.
+
+Con BOT_ROLE=all (por defecto) bot.py arranca estos workers en su propio
+proceso. Con BOT_ROLE=ingester, bot.py solo publica trabajos y las
+descargas corren en uno o varios procesos aparte:
+
+    python3 worker.py
+
+Los workers comparten la cola (SQLite en el mismo host, Redis entre
+máquinas). Un trabajo puede procesarse más de una vez si su worker muere
+a medias (at-least-once); los chats ya servidos se registran en la cola
+y no se repiten.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import http_client
+from config import (
+    BOT_TOKEN, DESTINATION_CHAT_IDS, DOWNLOAD_WORKERS, DOWNLOAD_WORKERS_PER_USER,
+    DOWNLOAD_POOL, STREAM_MODE, MEDIA_CACHE_PATH, MEDIA_CACHE_TTL, MEDIA_CACHE_MAX_ENTRIES,
+    QUEUE_BACKEND, DOWNLOAD_QUEUE_PATH, REDIS_URL, QUEUE_WORKERS, QUEUE_MAX_ATTEMPTS,
+    QUEUE_RETRY_DELAY, QUEUE_LEASE_SECONDS, QUEUE_POLL_INTERVAL, METRICS_PORT,
+    LOCAL_BOT_API_URL, LOCAL_BOT_API_BASE_URL, LOCAL_BOT_API_FILE_URL, LOCAL_BOT_API_TIMEOUT,
+    DOWNLOADS_DIR, STORAGE_QUOTA_MB, STORAGE_JOB_RESERVE_MB, STORAGE_TMPFS_DIR, STORAGE_TMPFS_QUOTA_MB,
+    STORAGE_SMALL_JOB_RESERVE_MB, STORAGE_ORPHAN_MAX_AGE, STORAGE_REAP_INTERVAL
+)
+from downloader import (
+    download_media, probe_download_size, resolve_media_key, is_remote_url, warm_up, MediaTooLargeError,
+    is_tiktok_slideshow, get_platform, instaloader_pool
+)
+from storage import StorageManager
+from download_pool import DownloadPool
+from media_cache import MediaCache
+from delivery import deliver_media, fan_out_cached, send_text, AlbumProgress
+from download_queue import DownloadQueue, DOWNLOADING, UPLOADING, album_key, delivered_albums
+from single_flight import SingleFlight
+from metrics import (
+    start_metrics_server, HANDLER_SECONDS, CACHE_REQUESTS_TOTAL, QUEUE_DEPTH, DOWNLOADS_IN_FLIGHT
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_download_queue():
+    """Crea la cola de trabajos según QUEUE_BACKEND ('sqlite' o 'redis')."""
+    options = dict(
+        max_attempts=QUEUE_MAX_ATTEMPTS,
+        retry_base_delay=QUEUE_RETRY_DELAY,
+        lease_seconds=QUEUE_LEASE_SECONDS
+    )
+    if QUEUE_BACKEND == 'redis':
+        from redis_queue import RedisDownloadQueue
+        return RedisDownloadQueue.from_url(REDIS_URL, **options)
+    return DownloadQueue(DOWNLOAD_QUEUE_PATH, **options)
+
+
+download_pool = DownloadPool(
+    max_workers=DOWNLOAD_WORKERS,
+    per_user_limit=DOWNLOAD_WORKERS_PER_USER,
+    use_processes=(DOWNLOAD_POOL == 'process'),
+    initializer=warm_up
+)
+
+media_cache = MediaCache(
+    MEDIA_CACHE_PATH,
+    ttl=MEDIA_CACHE_TTL,
+    max_entries=MEDIA_CACHE_MAX_ENTRIES
+)
+
+# Directorios temporales por trabajo, con cuota y limpieza de huérfanos
+storage = StorageManager(
+    DOWNLOADS_DIR,
+    quota_bytes=STORAGE_QUOTA_MB * 1024 * 1024,
+    job_reserve=STORAGE_JOB_RESERVE_MB * 1024 * 1024,
+    tmpfs_root=STORAGE_TMPFS_DIR or None,
+    tmpfs_quota=STORAGE_TMPFS_QUOTA_MB * 1024 * 1024,
+    small_job_reserve=STORAGE_SMALL_JOB_RESERVE_MB * 1024 * 1024,
+    orphan_max_age=STORAGE_ORPHAN_MAX_AGE
+)
+
+# Cola persistente de trabajos: los enlaces sobreviven a reinicios y redeploys
+download_queue = create_download_queue()
+queue_event = asyncio.Event()
+worker_tasks = []
+
+QUEUE_DEPTH.set_function(download_queue.depth)
+DOWNLOADS_IN_FLIGHT.set_function(lambda: download_pool.in_flight)
+
+
+def remove_temp_files(result):
+    """Borra los archivos temporales (y su directorio) de un resultado de download_media."""
+    downloaded_files = result[0]
+    if not downloaded_files:
+        return
+    for file_path in downloaded_files:
+        if is_remote_url(file_path):
+            continue
+        job = storage.job_for(file_path)
+        if job is not None:
+            storage.release(job)
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"🗑️ Archivo temporal eliminado: {file_path}")
+
+
+def is_small_media(resolved_url):
+    """Contenido que suele ser pequeño (candidato a tmpfs): slideshows y audio."""
+    return is_tiktok_slideshow(resolved_url) or get_platform(resolved_url) == 'spotify'
+
+
+async def download_in_job_dir(user_chat_id, resolved_url, streaming=False):
+    """
+    Descarga en un directorio propio del trabajo, reservado dentro de la
+    cuota (espera si no hay sitio). Con cuota se reserva el tamaño estimado
+    en el pre-vuelo (no en modo streaming, que suele no tocar el disco). Si no quedan archivos locales el directorio se libera
+    enseguida; si no, al limpiar el resultado.
+    """
+    small = is_small_media(resolved_url)
+    estimate = None
+    if storage.limited and not small and not streaming:
+        estimate = await download_pool.run(user_chat_id, probe_download_size, resolved_url)
+    job = await storage.acquire(small=small, estimate=estimate)
+    try:
+        result = await download_pool.run(user_chat_id, download_media, resolved_url, streaming, job.path)
+    except BaseException:
+        storage.release(job)
+        raise
+    files = result[0] or []
+    if any(not is_remote_url(f) for f in files):
+        storage.settle(job)
+    else:
+        storage.release(job)
+    return result
+
+
+# Descargas en curso compartidas entre trabajos con el mismo enlace; los
+# archivos se borran cuando el último trabajo termina de enviarlos
+in_flight = SingleFlight(cleanup=remove_temp_files)
+
+
+def shared_download(stack, user_chat_id, cache_key, resolved_url, streaming=False):
+    """Descarga (o se une a la descarga en curso de) un enlace dentro de stack."""
+    return stack.enter_async_context(in_flight.share(
+        (cache_key, streaming),
+        lambda: download_in_job_dir(user_chat_id, resolved_url, streaming)
+    ))
+
+
+# Subidas en curso por contenido: los trabajos que comparten una descarga
+# suben de uno en uno, y los que esperan reutilizan los file_ids del primero
+upload_locks = {}  # cache_key -> [asyncio.Lock, nº de trabajos que lo usan]
+
+
+@asynccontextmanager
+async def upload_lock(cache_key):
+    """Serializa las subidas de un mismo contenido (cache_key)."""
+    entry = upload_locks.setdefault(cache_key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del upload_locks[cache_key]
+
+
+class DeliveryIncomplete(Exception):
+    """Faltan chats por servir (el reintento envía solo a esos)."""
+
+    def __init__(self, missing):
+        # Sin los ids en el mensaje: puede acabar en un texto para el usuario
+        super().__init__(f"No se pudo enviar a {len(missing)} chat(s)")
+        self.missing = missing
+
+
+async def finish_delivery(bot, job, status):
+    """
+    Registra los chats servidos y confirma al usuario. Si falta algún chat
+    lanza DeliveryIncomplete: el reintento envía solo a los que faltan.
+    """
+    download_queue.mark_delivered(job['id'], [c for c, ok in status.items() if ok])
+    if status.get(job['user_chat_id']):
+        await send_text(bot, job['user_chat_id'], "✅ Descarga completada")
+    missing = [c for c, ok in status.items() if not ok]
+    if missing:
+        logger.warning(f"⚠️ Trabajo {job['id']}: faltan chats por servir: {', '.join(map(str, missing))}")
+        raise DeliveryIncomplete(missing)
+
+
+async def process_url_job(bot, job):
+    """
+    Procesa un trabajo de la cola: resolver, descargar y enviar.
+    Las excepciones se propagan para que el worker reintente el trabajo.
+    """
+    url = job['url']
+    user_chat_id = job['user_chat_id']
+
+    # Primero el usuario que lo pidió, luego los destinos configurados.
+    # Los chats ya servidos en un intento anterior no se repiten.
+    delivered = set(job.get('delivered') or ())
+    target_chats = [
+        c for c in [user_chat_id] + [c for c in DESTINATION_CHAT_IDS if c != user_chat_id]
+        if c not in delivered
+    ]
+    if not target_chats:
+        logger.info(f"♻️ Trabajo {job['id']} ya entregado a todos los chats")
+        return
+
+    # Álbumes de un slideshow ya enviados en un intento anterior (no se repiten)
+    progress = AlbumProgress(
+        delivered_albums(delivered),
+        on_sent=lambda chat_id, index: download_queue.mark_delivered(job['id'], [album_key(chat_id, index)])
+    )
+
+    async with AsyncExitStack() as stack:
+        # Resolver el enlace y buscarlo en la caché de resultados
+        cache_key, resolved_url = await asyncio.to_thread(resolve_media_key, url)
+        cached = media_cache.get(cache_key)
+        CACHE_REQUESTS_TOTAL.labels(cache='media', result='hit' if cached else 'miss').inc()
+
+        if cached:
+            download_queue.set_state(job['id'], UPLOADING)
+            media_type, file_ids, title = cached
+            caption = f"🎥 {title}"
+            status = await fan_out_cached(bot, target_chats, media_type, file_ids, caption, progress)
+            if any(status.values()):
+                logger.info(f"♻️ Enviado desde caché ({cache_key}) sin descargar")
+                await finish_delivery(bot, job, status)
+                return
+            # file_id inválido o caducado: descartar y descargar de nuevo
+            logger.warning(f"⚠️ Falló el envío desde caché ({cache_key}), descargando de nuevo")
+            media_cache.delete(cache_key)
+            download_queue.set_state(job['id'], DOWNLOADING)
+
+        # Ejecutar la descarga en el pool (no bloquea el event loop). Si otro
+        # trabajo ya está descargando el mismo contenido, se comparte.
+        downloaded_files, media_type, title = await shared_download(
+            stack, user_chat_id, cache_key, resolved_url, STREAM_MODE
+        )
+
+        if downloaded_files and all(is_remote_url(f) or os.path.exists(f) for f in downloaded_files):
+            async with upload_lock(cache_key):
+                download_queue.set_state(job['id'], UPLOADING)
+
+                # Otro trabajo con el mismo enlace pudo subirlo mientras se esperaba
+                cached = media_cache.get(cache_key)
+                if cached:
+                    cached_type, cached_ids, cached_title = cached
+                    status = await fan_out_cached(
+                        bot, target_chats, cached_type, cached_ids, f"🎥 {cached_title}", progress
+                    )
+                    if any(status.values()):
+                        logger.info(f"♻️ Reutilizados los file_ids de la subida en curso ({cache_key})")
+                        await finish_delivery(bot, job, status)
+                        return
+
+                # Caption SIN URL (según solicitud del usuario)
+                caption = f"🎥 {title}"
+
+                # 1. Subir una vez y distribuir por file_id al resto de destinos
+                file_ids, status = await deliver_media(
+                    bot, target_chats, downloaded_files, media_type, caption, progress
+                )
+
+                if not any(status.values()) and any(is_remote_url(f) for f in downloaded_files):
+                    # Telegram no pudo bajar la URL: descargar a disco y subir
+                    logger.warning("⚠️ Envío por URL rechazado, descargando a archivo temporal...")
+                    download_queue.set_state(job['id'], DOWNLOADING)
+                    downloaded_files, media_type, title = await shared_download(
+                        stack, user_chat_id, cache_key, resolved_url
+                    )
+                    if not downloaded_files:
+                        raise Exception("No se pudo descargar el contenido")
+                    download_queue.set_state(job['id'], UPLOADING)
+                    file_ids, status = await deliver_media(
+                        bot, target_chats, downloaded_files, media_type, caption, progress
+                    )
+
+                if not any(status.values()):
+                    raise Exception("No se pudo enviar el archivo a ningún chat")
+
+                # 2. Guardar los file_ids para reenviar sin descargar la próxima vez
+                if file_ids and all(file_ids):
+                    media_cache.put(cache_key, media_type, file_ids, title)
+
+                # 3. Confirmar al usuario; si faltó algún chat, reintentar solo esos
+                await finish_delivery(bot, job, status)
+        else:
+             logger.warning(f"⚠️ No se pudo descargar contenido de: {url}")
+             # Notificar al usuario del error
+             await send_text(
+                 bot, user_chat_id,
+                 "❌ No se pudo descargar el contenido de este link.\n\nPosibles razones:\n• Contenido privado o restringido\n• Link inválido\n• Plataforma no soportada"
+             )
+
+
+async def keep_lease(job_id):
+    """Renueva el lease del trabajo mientras se procesa."""
+    while True:
+        await asyncio.sleep(QUEUE_LEASE_SECONDS / 3)
+        try:
+            download_queue.heartbeat(job_id)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo renovar el lease del trabajo {job_id}: {e}")
+
+
+async def job_worker(bot, worker_id):
+    """Consume trabajos de la cola persistente a ritmo constante."""
+    while True:
+        queue_event.clear()
+        # No tomar trabajos de usuarios que ya agotaron su cupo de descargas
+        job = download_queue.claim(exclude_users=download_pool.busy_users())
+
+        if job is None:
+            # Esperar a un trabajo nuevo o al próximo reintento programado
+            delay = download_queue.next_run_delay()
+            timeout = QUEUE_POLL_INTERVAL if delay is None else min(max(delay, 1.0), QUEUE_POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(queue_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        logger.info(f"⚙️ Worker {worker_id} procesando trabajo {job['id']} (intento {job['attempts']}): {job['url']}")
+        lease_task = asyncio.create_task(keep_lease(job['id']))
+        try:
+            await process_url_job(bot, job)
+            download_queue.complete(job['id'])
+            # Latencia de extremo a extremo: desde que llegó el enlace (incluye la espera en cola)
+            HANDLER_SECONDS.labels(handler='url_job').observe(time.time() - job['created_at'])
+        except asyncio.CancelledError:
+            # Apagado: el trabajo queda a medias y se recupera al reiniciar
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error en trabajo {job['id']}: {e}")
+            # Si no cabe en el límite de Telegram, reintentar no sirve de nada
+            retry = not isinstance(e, MediaTooLargeError)
+            if not download_queue.fail(job['id'], e, retry=retry):
+                if isinstance(e, DeliveryIncomplete) and job['user_chat_id'] not in e.missing:
+                    # El usuario ya recibió su copia: lo que falló son otros destinos
+                    logger.error(f"❌ Trabajo {job['id']} sin más reintentos para {len(e.missing)} destino(s)")
+                else:
+                    # Sin más reintentos: notificar al usuario del error
+                    try:
+                        await send_text(
+                            bot, job['user_chat_id'],
+                            f"❌ Error procesando el link:\n{str(e)[:200]}"
+                        )
+                    except:
+                        pass
+        finally:
+            lease_task.cancel()
+            # Puede haber trabajos de este usuario esperando cupo
+            queue_event.set()
+
+
+def start_workers(bot, count=QUEUE_WORKERS):
+    """Arranca los workers de la cola en el event loop actual."""
+    # Precalentar yt-dlp ya, no en la primera descarga tras el deploy
+    download_pool.warm_up()
+    # Restos de ejecuciones anteriores (crash/kill a mitad de descarga)
+    storage.start_reaper(STORAGE_REAP_INTERVAL)
+    for i in range(count):
+        worker_tasks.append(asyncio.create_task(job_worker(bot, i + 1)))
+    logger.info(f"⚙️ {count} workers de cola iniciados ({download_queue.depth()} trabajos pendientes)")
+
+
+async def stop_workers():
+    """Cancela los workers y libera los recursos compartidos."""
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+    await storage.stop_reaper()
+    download_pool.shutdown()
+    instaloader_pool.close()
+    http_client.close()
+    media_cache.close()
+    download_queue.close()
+
+
+async def run_worker():
+    """Proceso worker independiente (BOT_ROLE=ingester en bot.py)."""
+    import signal
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    if LOCAL_BOT_API_URL:
+        # Servidor Bot API propio: archivos por ruta y sin el límite de 50 MB
+        bot = Bot(
+            BOT_TOKEN,
+            base_url=LOCAL_BOT_API_BASE_URL,
+            base_file_url=LOCAL_BOT_API_FILE_URL,
+            local_mode=True,
+            request=HTTPXRequest(read_timeout=LOCAL_BOT_API_TIMEOUT, write_timeout=LOCAL_BOT_API_TIMEOUT)
+        )
+    else:
+        bot = Bot(BOT_TOKEN)
+
+    async with bot:
+        download_queue.purge()
+        start_workers(bot)
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("🛑 Deteniendo worker...")
+            await stop_workers()
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if not BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN no configurado. Revisa tu archivo .env")
+        return
+
+    logger.info(f"⚙️ Worker de descargas: cola {QUEUE_BACKEND}, {DOWNLOAD_WORKERS} workers ({DOWNLOAD_POOL}), {DOWNLOAD_WORKERS_PER_USER} por usuario")
+    asyncio.run(run_worker())
+
+
+if __name__ == '__main__':
+    main()
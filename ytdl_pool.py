@@ -0,0 +1,120 @@
+"""
+Pool de instancias YoutubeDL reutilizables.
+
+Crear un YoutubeDL por intento vuelve a inicializar extractores, cabeceras
+y conexiones HTTP, y pierde las cookies de la sesión. El pool mantiene
+instancias vivas (extractores ya cargados, conexiones keep-alive) que
+comparten un mismo cookie jar; las opciones de cada petición (plantilla
+de salida, formato, User-Agent) se aplican sobre la instancia sin
+reconstruirla.
+
+YoutubeDL no es thread-safe: cada instancia la usa un solo hilo a la vez.
+"""
+
+import os
+import logging
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar
+
+logger = logging.getLogger(__name__)
+
+
+class YoutubeDLPool:
+    """Instancias YoutubeDL de larga vida con cookie jar compartido."""
+
+    def __init__(self, base_opts, size=4, max_uses=200, cookiefile=None):
+        self.base_opts = dict(base_opts)
+        if cookiefile:
+            self.base_opts['cookiefile'] = cookiefile
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = []
+        self._uses = {}
+        self._lock = threading.Lock()
+
+        self.cookiejar = YoutubeDLCookieJar(cookiefile)
+        if cookiefile and os.path.exists(cookiefile):
+            try:
+                self.cookiejar.load()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudieron cargar las cookies de {cookiefile}: {e}")
+
+    def _create(self):
+        ydl = yt_dlp.YoutubeDL(dict(self.base_opts))
+        # cookiejar es una cached_property: asignarla comparte el jar entre instancias
+        ydl.cookiejar = self.cookiejar
+        return ydl
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._create()
+
+    def _checkin(self, ydl):
+        with self._lock:
+            uses = self._uses.get(id(ydl), 0) + 1
+            keep = uses < self.max_uses and len(self._idle) < self.size
+            if keep:
+                self._uses[id(ydl)] = uses
+                self._idle.append(ydl)
+                return
+            self._uses.pop(id(ydl), None)
+        # Instancia agotada o sobrante: se cierra (se crea otra cuando haga falta)
+        ydl.close()
+
+    @staticmethod
+    def _configure(ydl, outtmpl=None, format=None, user_agent=None, referer=None):
+        """Aplica las opciones de la petición sobre una instancia ya creada."""
+        if outtmpl is not None:
+            ydl.params['outtmpl']['default'] = outtmpl
+        if format is not None and ydl.params.get('format') != format:
+            ydl.params['format'] = format
+            ydl.format_selector = ydl.build_format_selector(format)
+        headers = ydl.params['http_headers']
+        changed = False
+        if user_agent and headers.get('User-Agent') != user_agent:
+            headers['User-Agent'] = user_agent
+            changed = True
+        if referer and headers.get('Referer') != referer:
+            headers['Referer'] = referer
+            changed = True
+        if changed:
+            # _request_director es una cached_property que copia las cabeceras al
+            # crearse: sin descartarla, las peticiones seguirían con las anteriores
+            director = ydl.__dict__.pop('_request_director', None)
+            if director is not None:
+                director.close()
+
+    @contextmanager
+    def acquire(self, **options):
+        """
+        Presta una instancia configurada para una petición. options:
+        outtmpl, format, user_agent, referer.
+        """
+        ydl = self._checkout()
+        try:
+            self._configure(ydl, **options)
+            yield ydl
+        finally:
+            self._checkin(ydl)
+
+    def warm_up(self, ie_keys=()):
+        """Crea las instancias y carga de antemano los extractores indicados."""
+        instances = [self._checkout() for _ in range(self.size)]
+        for ydl in instances:
+            for ie_key in ie_keys:
+                ydl.get_info_extractor(ie_key)
+        for ydl in instances:
+            self._checkin(ydl)
+        logger.info(f"🔥 Pool de yt-dlp listo: {len(instances)} instancias ({', '.join(ie_keys)})")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._uses.clear()
+        for ydl in idle:
+            ydl.close()